@@ -0,0 +1,108 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, NamedTuple
+
+
+class Overloaded(Exception):
+    """推薦計算的佇列已滿（或等待逾時），應回 503 讓 client 稍後重試"""
+
+
+class QualityTier(NamedTuple):
+    name: str
+    max_load: int      # 進場時 (計算中 + 等待中) 的數量低於此值才使用這個等級
+    fraction: float    # 模擬次數 = Manager 預設 num_sim * fraction
+
+
+class ComputeGate():
+    """
+    所有 endpoint 都是 sync def，get_recommendation 會在 Starlette 的 thread pool 裡搶 GIL。
+    這裡限制同時計算的數量，負載升高時依序降低模擬次數，超過上限則直接拒絕。
+    """
+
+    def __init__(self, concurrency: int = 2, max_queue: int = 8, queue_timeout: float = 5.0,
+                 tiers: List[QualityTier] = None) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tiers = tiers or [
+            QualityTier("full", concurrency, 1.0),
+            QualityTier("reduced", concurrency + max_queue // 2, 0.3),
+            QualityTier("minimal", concurrency + max_queue, 0.1),
+        ]
+
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+
+        # 統計
+        self.served = {tier.name: 0 for tier in self.tiers}
+        self.shed = 0
+        self.background = 0
+
+    @classmethod
+    def from_env(cls) -> 'ComputeGate':
+        return cls(
+            concurrency=int(os.environ.get("BJ_COMPUTE_CONCURRENCY", 2)),
+            max_queue=int(os.environ.get("BJ_COMPUTE_QUEUE", 8)),
+            queue_timeout=float(os.environ.get("BJ_COMPUTE_TIMEOUT", 5.0)),
+        )
+
+    def _pick_tier(self, load: int) -> QualityTier:
+        for tier in self.tiers:
+            if load < tier.max_load:
+                return tier
+        return self.tiers[-1]
+
+    @contextmanager
+    def admit(self):
+        """`with gate.admit() as tier:` 取得計算名額與本次使用的品質等級"""
+        with self._lock:
+            load = self.active + self.waiting
+            if load >= self.concurrency + self.max_queue:
+                self.shed += 1
+                raise Overloaded()
+            tier = self._pick_tier(load)
+            self.waiting += 1
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.shed += 1
+                raise Overloaded()
+            self.active += 1
+            self.served[tier.name] += 1
+
+        try:
+            yield tier
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """背景工作用：不等待，只在沒有請求排隊時佔用名額，且（concurrency > 1 時）至少保留一個名額給請求（結束後呼叫 release）"""
+        with self._lock:
+            if self.waiting or self.active >= max(1, self.concurrency - 1) or not self._slots.acquire(blocking=False):
+                return False
+            self.active += 1
+            self.background += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "served": dict(self.served),
+                "shed": self.shed,
+                "background": self.background,
+                "tiers": [tier._asdict() for tier in self.tiers],
+            }
@@ -0,0 +1,298 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
+
+import json
+import mmap
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+import click
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): games.txt is then safe for a single writer process only
+    fcntl = None
+
+from Utils import *
+
+
+"""
+========================================================================================================================
+Global Variable
+========================================================================================================================
+"""
+MAX_CARDS = 6
+ACTION_CODES = {'STAND': 0, 'HIT': 1, 'DOUBLE': 2}
+CODE_ACTIONS = {v: k for k, v in ACTION_CODES.items()}
+UNKNOWN = 255
+
+# timestamp, interned game id, card count, card slots, upcard, taken, recommended, mistake flag, padding -> 24 bytes
+RECORD = struct.Struct('<dIB{}BBBBBx'.format(MAX_CARDS))
+
+SEGMENT_PREFIX = 'decisions-'
+GAMES_FILE = 'games.txt'
+
+
+def numpy_dtype():
+
+    # Same layout as RECORD, for np.memmap over a segment
+    import numpy as np
+    return np.dtype([
+        ('timestamp', '<f8'), ('game', '<u4'), ('n_cards', 'u1'), ('cards', 'u1', (MAX_CARDS,)),
+        ('upcard', 'u1'), ('taken', 'u1'), ('recommended', 'u1'), ('mistake', 'u1'), ('pad', 'u1')
+    ])
+
+
+"""
+========================================================================================================================
+Append-only Writer
+========================================================================================================================
+"""
+class DecisionLogWriter():
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, directory: str, segment_records: int = 1 << 20) -> None:
+
+        self.directory = directory
+        self.segment_records = segment_records
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok = True)
+
+        # Interned game ids: line number in games.txt, shared by every worker process appending to this directory
+        self.games: Dict[str, int] = {}
+        self.games_offset = 0
+        self.games_file = open(os.path.join(directory, GAMES_FILE), 'a+')
+        self._sync_games()
+
+        # Continue the last segment if it still has room
+        segments = list_segments(directory)
+        self.segment_index = int(os.path.basename(segments[-1])[len(SEGMENT_PREFIX):-4]) if segments else 0
+        self._open_segment()
+
+        return
+
+    def _open_segment(self) -> None:
+
+        path = os.path.join(self.directory, '{}{:06d}.bin'.format(SEGMENT_PREFIX, self.segment_index))
+        self.segment = open(path, 'ab')
+
+        return
+
+    def _sync_games(self) -> None:
+
+        # Pick up ids appended by other processes since the last read
+        self.games_file.seek(self.games_offset)
+        for line in self.games_file.read().splitlines():
+            self.games.setdefault(line, len(self.games))
+        self.games_offset = self.games_file.tell()
+
+        return
+
+    def _intern(self, game_id: str) -> int:
+
+        if game_id not in self.games:
+            if fcntl is not None:
+                fcntl.flock(self.games_file, fcntl.LOCK_EX)
+            try:
+                self._sync_games()
+                if game_id not in self.games:
+                    self.games_file.write(game_id + '\n')
+                    self.games_file.flush()
+                    self.games[game_id] = len(self.games)
+                    self.games_offset = self.games_file.tell()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.games_file, fcntl.LOCK_UN)
+
+        return self.games[game_id]
+
+    """
+    ====================================================================================================================
+    Same signature as database.log_action
+    ====================================================================================================================
+    """
+    def log_action(self, game_id, p_hand, d_upcard, taken, recommended, is_mistake) -> None:
+
+        cards = [parse_card(c) for c in p_hand][:MAX_CARDS]
+        fields = (
+            len(cards), *(cards + [0] * (MAX_CARDS - len(cards))),
+            parse_card(d_upcard) if d_upcard is not None else 0,
+            ACTION_CODES.get(str(taken).upper(), UNKNOWN), ACTION_CODES.get(str(recommended).upper(), UNKNOWN),
+            1 if is_mistake else 0
+        )
+
+        with self.lock:
+            # Append-mode position is the real end of file, so workers sharing a segment roll over together
+            while self.segment.tell() // RECORD.size >= self.segment_records:
+                self.segment.close()
+                self.segment_index += 1
+                self._open_segment()
+
+            self.segment.write(RECORD.pack(time.time(), self._intern(game_id), *fields))
+            self.segment.flush()
+
+        return
+
+    def close(self) -> None:
+
+        with self.lock:
+            self.segment.close()
+            self.games_file.close()
+
+        return
+
+
+"""
+========================================================================================================================
+Readers
+========================================================================================================================
+"""
+def list_segments(directory: str) -> List[str]:
+
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.startswith(SEGMENT_PREFIX) and n.endswith('.bin'))
+
+    return [os.path.join(directory, n) for n in names]
+
+
+def read_games(directory: str) -> List[str]:
+
+    path = os.path.join(directory, GAMES_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def scan(directory: str) -> Iterator[tuple]:
+
+    # Raw tuples straight off the memory-mapped segments (a torn trailing record is ignored)
+    for path in list_segments(directory):
+        size = os.path.getsize(path) // RECORD.size * RECORD.size
+        if size == 0:
+            continue
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as m:
+            yield from RECORD.iter_unpack(memoryview(m)[:size])
+
+
+def load_columns(directory: str) -> list:
+
+    # Vectorised scans: one structured np.memmap per segment (not concatenated, so nothing is copied into RAM)
+    import numpy as np
+    dtype = numpy_dtype()
+    parts = []
+    for path in list_segments(directory):
+        n = os.path.getsize(path) // dtype.itemsize
+        if n:
+            parts.append(np.memmap(path, dtype = dtype, mode = 'r', shape = (n,)))
+
+    return parts
+
+
+"""
+========================================================================================================================
+Converter
+========================================================================================================================
+"""
+def to_sqlite(directory: str, db_name: str, batch: int = 10000) -> int:
+
+    import database
+    database.DB_NAME = db_name
+    database.init_db()
+
+    games = read_games(directory)
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+
+    # Same text encoding main.py writes: "A" / "2".."13" for the hand, str(rank) for the upcard
+    def row(fields):
+        ts, game, n_cards = fields[:3]
+        cards = fields[3:3 + n_cards]
+        upcard, taken, recommended, mistake = fields[3 + MAX_CARDS:]
+        return (
+            games[game] if game < len(games) else None,
+            datetime.fromtimestamp(ts),
+            json.dumps([str(r) if r != 1 else "A" for r in cards]),
+            str(upcard) if upcard else None,
+            CODE_ACTIONS.get(taken), CODE_ACTIONS.get(recommended),
+            bool(mistake)
+        )
+
+    insert = '''
+        INSERT INTO action_logs (game_id, timestamp, player_hand, dealer_upcard, action_taken, action_recommended, is_mistake)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    total = 0
+    pending = []
+    for fields in scan(directory):
+        pending.append(row(fields))
+        if len(pending) >= batch:
+            c.executemany(insert, pending)
+            conn.commit()
+            total += len(pending)
+            pending = []
+    if pending:
+        c.executemany(insert, pending)
+        conn.commit()
+        total += len(pending)
+    conn.close()
+
+    return total
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+@click.group()
+def cli():
+
+    pass
+
+
+@cli.command('to-sqlite')
+@click.option('--dir', 'directory', default = 'decision_logs', show_default = True)
+@click.option('--db', 'db_name', default = 'blackjack.db', show_default = True)
+def to_sqlite_command(directory, db_name):
+
+    click.echo('{} decisions loaded into {}'.format(to_sqlite(directory, db_name), db_name))
+
+    return
+
+
+@cli.command()
+@click.option('--dir', 'directory', default = 'decision_logs', show_default = True)
+def stats(directory):
+
+    try:
+        parts = load_columns(directory)
+        n, mistakes = sum(len(p) for p in parts), sum(int(p['mistake'].sum()) for p in parts)
+    except ImportError:
+        rows = list(scan(directory))
+        n, mistakes = len(rows), sum(r[-1] for r in rows)
+
+    click.echo('segments={}  games={}  decisions={}  mistake_rate={:.1%}'.format(
+        len(list_segments(directory)), len(read_games(directory)), n, mistakes / n if n else 0.0))
+
+    return
+
+
+if __name__ == "__main__":
+
+    cli()
@@ -0,0 +1,209 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
+
+import math
+import random
+import struct
+from typing import Dict, List
+
+import click
+
+from Manager import Manager
+from Simulator import Simulator
+from Utils import *
+
+
+"""
+========================================================================================================================
+Global Variable
+========================================================================================================================
+"""
+MAGIC = b'BJDRILL1'
+ACTIONS = ('STAND', 'HIT', 'DOUBLE')
+MAX_CARDS = 5
+
+# num_decks, penetration %, card count, 5 card slots, upcard, best action code, EV per action (NaN = not allowed)
+RECORD = struct.Struct('<BBB{}BBB3f'.format(MAX_CARDS))
+
+
+"""
+========================================================================================================================
+Offline Generator
+========================================================================================================================
+"""
+def sample_state(rng: random.Random, num_decks: int, penetration: float, hit_prob: float):
+
+    # Same dealing path as a live session: a seeded Manager shoe already dealt down to the penetration
+    gm = Manager(num_decks = num_decks, approx_cache = None, shoe_mode = 'physical', seed = rng.randint(0, 2**31-1))
+    for _ in range(int(gm.shoe.remaining() * penetration)):
+        gm.shoe.draw_one()
+
+    gm.start_round()
+    gm.deal_initial()
+
+    # Some decisions come after a hit
+    while not gm.finish and len(gm.player_hand) < 4 and rng.random() < hit_prob:
+        gm.player_hit()
+
+    # Finished rounds and naturals are not decisions
+    if gm.finish or gm.player_hand.best_value() >= 21:
+        return None
+
+    return gm
+
+
+def generate_pool(path: str, size: int, num_decks_list: List[int], penetrations: List[float], num_sim: int,
+                  hit_prob: float = 0.3, seed: int = 0) -> int:
+
+    rng = random.Random(seed)
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        with click.progressbar(length = size, label = 'Generating drill pool') as bar:
+            while written < size:
+
+                num_decks = rng.choice(num_decks_list)
+                penetration = rng.choice(penetrations)
+                gm = sample_state(rng, num_decks, penetration, hit_prob)
+                if gm is None:
+                    continue
+
+                # Strongest engine available: stratified over the first draws
+                simulator = Simulator(gm.shoe, num_sim, rng_seed = rng.randint(0, 2**31-1), sampling = 'stratified')
+                rec = simulator.evaluate_all(gm.player_hand.cards, gm.dealer_hand.cards)
+
+                cards = gm.player_hand.cards + [0] * (MAX_CARDS - len(gm.player_hand.cards))
+                evs = [rec['results'][a]['ev'] if a in rec['results'] else math.nan for a in ACTIONS]
+                f.write(RECORD.pack(num_decks, int(round(penetration * 100)), len(gm.player_hand.cards), *cards,
+                                    gm.dealer_hand.cards[0], ACTIONS.index(rec['best_action']), *evs))
+
+                written += 1
+                bar.update(1)
+
+    return written
+
+
+"""
+========================================================================================================================
+Drill Pool (O(1) serving and grading)
+========================================================================================================================
+"""
+class DrillPool():
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, path: str) -> None:
+
+        with open(path, 'rb') as f:
+            self.data = f.read()
+
+        if not self.data.startswith(MAGIC) or (len(self.data) - len(MAGIC)) % RECORD.size:
+            raise ValueError("{} is not a drill pool".format(path))
+
+        self.size = (len(self.data) - len(MAGIC)) // RECORD.size
+        self.rng = random.Random()
+
+        return
+
+    def __len__(self) -> int:
+
+        return self.size
+
+    """
+    ====================================================================================================================
+
+    ====================================================================================================================
+    """
+    def record(self, index: int) -> Dict:
+
+        if not 0 <= index < self.size:
+            raise IndexError("No scenario {}".format(index))
+
+        fields = RECORD.unpack_from(self.data, len(MAGIC) + index * RECORD.size)
+        num_decks, penetration, n_cards = fields[:3]
+        upcard, best = fields[3 + MAX_CARDS:5 + MAX_CARDS]
+        evs = fields[5 + MAX_CARDS:]
+
+        return {
+            'num_decks': num_decks,
+            'penetration': penetration / 100.0,
+            'player_cards': list(fields[3:3 + n_cards]),
+            'upcard': upcard,
+            'best_action': ACTIONS[best],
+            'evs': {a: ev for a, ev in zip(ACTIONS, evs) if not math.isnan(ev)}
+        }
+
+    def random_index(self) -> int:
+
+        return self.rng.randrange(self.size)
+
+    def grade(self, index: int, action: str) -> Dict:
+
+        rec = self.record(index)
+        action = action.upper()
+        if action not in rec['evs']:
+            raise ValueError("Invalid action")
+
+        return {
+            'correct': action == rec['best_action'],
+            'chosen_action': action,
+            'best_action': rec['best_action'],
+            'ev_loss': rec['evs'][rec['best_action']] - rec['evs'][action],
+            'evaluations': rec['evs']
+        }
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+@click.group()
+def cli():
+
+    pass
+
+
+@cli.command()
+@click.option('--out', default = 'drill_pool.bin', show_default = True)
+@click.option('--size', default = 2000, show_default = True, help = 'Number of scenarios.')
+@click.option('--decks', default = '1,2,6,8', show_default = True, help = 'Comma-separated num_decks values.')
+@click.option('--penetrations', default = '0,0.1,0.2,0.3,0.4,0.5', show_default = True)
+@click.option('--num-sim', default = 20000, show_default = True)
+@click.option('--hit-prob', default = 0.3, show_default = True, help = 'Chance of drawing another card before the decision.')
+@click.option('--seed', default = 0, show_default = True)
+def generate(out, size, decks, penetrations, num_sim, hit_prob, seed):
+
+    written = generate_pool(out, size, [int(x) for x in decks.split(',')], [float(x) for x in penetrations.split(',')],
+                            num_sim, hit_prob = hit_prob, seed = seed)
+    click.echo('{} scenarios ({} bytes each) written to {}'.format(written, RECORD.size, out))
+
+    return
+
+
+@cli.command()
+@click.argument('path', default = 'drill_pool.bin')
+@click.option('--count', default = 5, show_default = True)
+def show(path, count):
+
+    pool = DrillPool(path)
+    click.echo('{} scenarios'.format(len(pool)))
+    for i in range(min(count, len(pool))):
+        rec = pool.record(i)
+        click.echo('  {} vs {}: {}  {}'.format([card_str(c) for c in rec['player_cards']], card_str(rec['upcard']),
+                                               rec['best_action'], {a: round(ev, 3) for a, ev in rec['evs'].items()}))
+
+    return
+
+
+if __name__ == "__main__":
+
+    cli()
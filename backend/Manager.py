@@ -2,18 +2,46 @@ from Utils import *
 from Game import *
 from Simulator import Simulator
 from Hand import Hand
-from Shoe import Shoe
+from Shoe import Shoe, PhysicalShoe
+from RecommendationCache import ApproxRecommendationCache, default_cache
+from Admission import ComputeGate
+from concurrent.futures import ThreadPoolExecutor
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
 
+# 先行發牌的推薦計算（所有 Manager 共用）
+speculation_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculative-deal")
+
 
 class Manager():
-    def __init__(self, num_decks: int = 6, num_sim: int = 10000, threshold_ratio: float = 0.5) -> None:
+    def __init__(self, num_decks: int = 6, num_sim: int = 10000, threshold_ratio: float = 0.5,
+                 approx_cache: ApproxRecommendationCache = default_cache,
+                 shoe_mode: str = "random", seed: int = None,
+                 speculative: bool = False, gate: ComputeGate = None) -> None:
         self.base = Shoe(num_decks=num_decks)
-        self.shoe = self.base.clone()
+
+        # "random": 每次抽牌依剩餘張數加權隨機
+        # "physical": 開局洗一次牌、依序發牌，記下 seed 即可完整重現整個 session
+        self.shoe_mode = shoe_mode
+        if shoe_mode == "physical":
+            self.shoe = PhysicalShoe(num_decks=num_decks, seed=seed)
+        elif shoe_mode == "random":
+            self.shoe = self.base.clone()
+        else:
+            raise ValueError("Unknown shoe mode {}".format(shoe_mode))
         self.simu = Simulator(self.shoe, num_sim)
 
+        # 近似快取（依牌靴組成的粗略特徵分桶），None = 停用
+        self.approx_cache = approx_cache
+
+        # 先行發牌：回合結束後先抽好下一局的起手牌（不公開），並在背景算好推薦
+        # gate: 背景計算也佔用一個計算名額；沒有空名額（server 忙碌）時只先抽牌、不做背景計算
+        self.speculative = speculative
+        self.gate = gate
+        self.pending_cards = None     # [player, player, dealer]
+        self.pending_rec = None       # Future[(decision_key, rec)]
+
         # 仕様書に合わせて threshold を「残り枚数」で管理
         # 例: 4副(208枚)なら 104枚になったら終了
         self.initial_shoe_size = self.base.remaining()
@@ -37,17 +65,75 @@ class Manager():
         self.result = None
         self.final_player_value = None
         self.final_dealer_value = None
+        self.last_recommendation = None  # (decision_key, rec)
 
     def deal_initial(self):
-        self.player_hand.add_card(self.shoe.draw_one())
-        self.player_hand.add_card(self.shoe.draw_one())
-        self.dealer_hand.add_card(self.shoe.draw_one())
+        # 已先行抽好的牌直接使用（抽牌順序與下面相同）
+        if self.pending_cards is not None:
+            cards, self.pending_cards = self.pending_cards, None
+        else:
+            cards = [self.shoe.draw_one() for _ in range(3)]
+        self.player_hand.add_card(cards[0])
+        self.player_hand.add_card(cards[1])
+        self.dealer_hand.add_card(cards[2])
 
         # ラウンド数をカウントアップ
         self.rounds_played += 1
 
-    def get_recommendation(self) -> dict:
-        return self.simu.evaluate_all(player_cards=self.player_hand.cards, dealer_cards=self.dealer_hand.cards)
+    def decision_key(self) -> tuple:
+        # 同一決策狀態：手牌、莊家牌與牌靴剩餘張數都相同
+        return (tuple(self.player_hand.cards), tuple(self.dealer_hand.cards), self.visible_remaining())
+
+    def recall_recommendation(self):
+        # 先行計算的推薦：還沒開始就取消、改走一般的計算流程；已在計算中就等它（比重新計算快，也不會重複佔用名額）
+        if self.pending_rec is not None and self.pending_cards is None:
+            future, self.pending_rec = self.pending_rec, None
+            if not future.cancel():
+                try:
+                    key, rec = future.result()
+                    self.remember_recommendation(rec, key)
+                except Exception:
+                    pass
+        if self.last_recommendation is not None and self.last_recommendation[0] == self.decision_key():
+            return self.last_recommendation[1]
+        return None
+
+    def remember_recommendation(self, rec: dict, key: tuple = None) -> None:
+        # key: 計算開始時的 decision_key（計算期間狀態可能已被其他請求改變）
+        self.last_recommendation = (key or self.decision_key(), rec)
+
+    def lookup_recommendation(self):
+        # 近似快取：只有在最佳動作的差距大於誤差估計時才會回傳，否則為 None
+        if self.approx_cache is None:
+            return None
+        return self.approx_cache.lookup(self.player_hand.cards, self.dealer_hand.cards, self.visible_shoe())
+
+    def get_recommendation(self, num_sim: int = None) -> dict:
+        # num_sim: 負載時由 main.py 下調的模擬次數（None = 預設值）
+        simu = self.visible_simulator()
+        rec = simu.evaluate_all(player_cards=self.player_hand.cards, dealer_cards=self.dealer_hand.cards, num_sim=num_sim)
+        if self.approx_cache is not None:
+            self.approx_cache.store(self.player_hand.cards, self.dealer_hand.cards, simu.base_shoe, rec)
+        return rec
+
+    def get_effect_of_removal(self, num_sim: int = None) -> dict:
+        # 從目前牌靴各移除一張 A..K 時，對這手牌各動作 EV 的影響（一次模擬共用所有樣本）
+        return self.visible_simulator().effect_of_removal(player_cards=self.player_hand.cards, dealer_cards=self.dealer_hand.cards, num_sim=num_sim)
+
+    def visible_shoe(self) -> Shoe:
+        # 先行抽出的牌放回去的牌靴快照（回合結束後的分析不能透露下一局的牌）
+        if not self.pending_cards:
+            return self.shoe
+        shoe = self.shoe.clone()
+        for rank in self.pending_cards:
+            shoe.counts[rank] += 1
+        return shoe
+
+    def visible_simulator(self) -> Simulator:
+        if not self.pending_cards:
+            return self.simu
+        return Simulator(self.visible_shoe(), self.simu.num_sim, self.simu.blackjack_payout,
+                         sampling=self.simu.sampling, allocation=self.simu.allocation)
 
     def player_hit(self) -> None:
         self.actions_taken.append("hit")  # 履歴に追加
@@ -74,12 +160,50 @@ class Manager():
             self.player_hand, self.dealer_hand, blackjack_payout=self.simu.blackjack_payout)
         self.final_player_value = self.player_hand.best_value()
         self.final_dealer_value = self.dealer_hand.best_value()
+        if self.speculative:
+            self.prepare_next_round()
+
+    def prepare_next_round(self) -> None:
+        # 只在下一局確定會開始時才抽（session 結束判定用的是 visible_remaining）
+        if self.pending_cards is not None or self.visible_remaining() <= self.stop_threshold or self.shoe.remaining() < 3:
+            return
+        self.pending_cards = [self.shoe.draw_one() for _ in range(3)]
+        self.pending_rec = None       # 上一局沒用到的先行推薦直接丟掉
+
+        # 不等待：沒有空名額就不算；名額在計算結束（或被取消）時歸還
+        if self.gate is not None and not self.gate.try_acquire():
+            return
+        # 牌靴此時已等於下一局第一個決策時的狀態；用快照計算，不動到正在使用的牌靴
+        player_cards, dealer_cards = self.pending_cards[:2], self.pending_cards[2:]
+        key = (tuple(player_cards), tuple(dealer_cards), self.shoe.remaining())
+        snapshot = self.shoe.clone()
+        self.pending_rec = speculation_pool.submit(self._speculate, player_cards, dealer_cards, snapshot, key)
+        if self.gate is not None:
+            self.pending_rec.add_done_callback(lambda _: self.gate.release())
+
+    def _speculate(self, player_cards: list, dealer_cards: list, snapshot: Shoe, key: tuple):
+        simu = Simulator(snapshot, self.simu.num_sim, self.simu.blackjack_payout,
+                         sampling=self.simu.sampling, allocation=self.simu.allocation)
+        rec = simu.evaluate_all(player_cards, dealer_cards)
+        rec["quality"] = {"tier": "speculative", "num_sim": self.simu.num_sim}
+        if self.approx_cache is not None:
+            self.approx_cache.store(player_cards, dealer_cards, snapshot, rec)
+        return key, rec
+
+    def visible_remaining(self) -> int:
+        # 先行抽出的牌在公開前仍算在牌靴內
+        return self.shoe.remaining() + (len(self.pending_cards) if self.pending_cards else 0)
+
+    def shoe_seed(self):
+        # physical 模式才有可重現的 seed
+        return getattr(self.shoe, "seed", None)
 
     # --- 新追加: 残りカードの統計（ヒント機能用） ---
     def get_shoe_composition(self) -> dict:
         # Utils.pyのcard_strを使って "A", "2"... "K" のキーに変換
+        # 先行抽出的牌尚未公開，仍算在剩餘牌中
         comp = {}
-        for rank, count in self.shoe.counts.items():
+        for rank, count in self.visible_shoe().counts.items():
             key = card_str(rank)
             comp[key] = comp.get(key, 0) + count
         return comp
@@ -0,0 +1,179 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
+
+import copy
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from Shoe import Shoe
+from Hand import Hand
+from Utils import *
+
+
+"""
+========================================================================================================================
+Approximate Recommendation Cache
+========================================================================================================================
+"""
+class ApproxRecommendationCache():
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, max_entries: int = 50000, z: float = 2.0, bucket_slack: float = 0.02) -> None:
+
+        # Entries answer only when best-action margin > z * stderr(margin) + bucket_slack
+        self.max_entries = max_entries
+        self.z = z
+        self.bucket_slack = bucket_slack
+
+        self.entries: 'OrderedDict[tuple, Dict]' = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.uncertain = 0
+
+        return
+
+    """
+    ====================================================================================================================
+    Coarse Composition Signature
+    ====================================================================================================================
+    """
+    def signature(self, shoe: Shoe) -> tuple:
+
+        counts = shoe.counts
+        remaining = shoe.remaining()
+        if remaining == 0:
+            return (shoe.num_decks, 0, 0, 0, 0)
+        decks_left = remaining / 52.0
+
+        # Hi-Lo true count (high cards left minus low cards left, per remaining deck)
+        high = sum(counts[r] for r in (1, 10, 11, 12, 13))
+        low = sum(counts[r] for r in (2, 3, 4, 5, 6))
+        true_count = max(-6, min(6, round((high - low) / decks_left)))
+
+        # Penetration in tenths, ace / ten densities relative to a fresh shoe in steps of 10%
+        penetration = int(10 * (1 - remaining / (52.0 * shoe.num_decks)))
+        ace_density = round(10 * counts[1] * 13 / remaining)
+        ten_density = round(10 * (high - counts[1]) * 13 / (4 * remaining))
+
+        return (shoe.num_decks, true_count, penetration, ace_density, ten_density)
+
+    def key(self, player_cards: List[Rank], dealer_cards: List[Rank], shoe: Shoe) -> tuple:
+
+        # Player state: total, softness and card-count class (2 = can double, 5+ = stand only)
+        total, is_soft = Hand(list(player_cards)).values()
+        n_cards = 2 if len(player_cards) == 2 else (5 if len(player_cards) >= 5 else 3)
+
+        return (total, is_soft, n_cards, RANK_TO_VALUE[dealer_cards[0]]) + self.signature(shoe)
+
+    """
+    ====================================================================================================================
+    Error Estimate
+    ====================================================================================================================
+    """
+    def error_estimate(self, rec: Dict) -> tuple:
+
+        ranked = sorted(rec['results'].values(), key = lambda s: s['ev'], reverse = True)
+        if len(ranked) < 2:
+            return math.inf, 0.0
+
+        def stderr(stats):
+            return stats.get('stderr', stats['stddev'] / math.sqrt(stats['n']) if stats['n'] else math.inf)
+
+        margin = ranked[0]['ev'] - ranked[1]['ev']
+        error = self.z * math.sqrt(stderr(ranked[0]) ** 2 + stderr(ranked[1]) ** 2) + self.bucket_slack
+
+        return margin, error
+
+    """
+    ====================================================================================================================
+    Lookup / Store
+    ====================================================================================================================
+    """
+    def lookup(self, player_cards: List[Rank], dealer_cards: List[Rank], shoe: Shoe) -> Optional[Dict]:
+
+        key = self.key(player_cards, dealer_cards, shoe)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry['margin'] <= entry['error']:
+                self.uncertain += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        # Stats come from a neighbouring shoe; the hands are the caller's
+        rec = copy.deepcopy(entry['rec'])
+        rec['player_hand'] = [card_str(r) for r in player_cards]
+        rec['dealer_hand'] = [card_str(r) for r in dealer_cards]
+        rec['cache'] = {'tier': 'approx', 'margin': entry['margin'], 'error': entry['error']}
+
+        return rec
+
+    def store(self, player_cards: List[Rank], dealer_cards: List[Rank], shoe: Shoe, rec: Dict) -> None:
+
+        key = self.key(player_cards, dealer_cards, shoe)
+        margin, error = self.error_estimate(rec)
+        with self.lock:
+
+            # Keep whichever evaluation of the bucket is more certain
+            entry = self.entries.get(key)
+            if entry is None or error < entry['error']:
+                self.entries[key] = {'rec': copy.deepcopy(rec), 'margin': margin, 'error': error}
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+
+        return
+
+    def stats(self) -> Dict:
+
+        with self.lock:
+            lookups = self.hits + self.misses + self.uncertain
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncertain': self.uncertain,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared by every Manager in the process
+default_cache = ApproxRecommendationCache()
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+if __name__ == "__main__":
+
+    import random
+    from Simulator import Simulator
+
+    shoe = Shoe(num_decks = 6, rng = random.Random(1))
+    cache = ApproxRecommendationCache()
+
+    rec = Simulator(shoe, num_sim = 2000, rng_seed = 1).evaluate_all([10, 10], [6])
+    cache.store([10, 10], [6], shoe, rec)
+
+    shoe.draw_one()
+    print(cache.lookup([10, 12], [6], shoe))
+    print(cache.stats())
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import database
+
+
+class RetentionScheduler():
+    """
+    action_logs 每次點擊就多一列且從不清理。
+    定期把超過保存期限的原始紀錄彙總成每日統計（database.action_rollups），
+    再分批刪除或封存原始列，最後做 WAL checkpoint，讓資料庫大小與查詢時間維持有界。
+    """
+
+    def __init__(self, max_age_days: int = 30, interval_seconds: float = 3600.0, chunk_size: int = 1000,
+                 archive_db: str = None, vacuum: bool = False) -> None:
+        self.max_age_days = max_age_days
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self.archive_db = archive_db      # None = 直接刪除
+        self.vacuum = vacuum
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.last_run = None
+        self.last_result = None
+        self.error = None
+
+    @classmethod
+    def from_env(cls) -> 'RetentionScheduler':
+        return cls(
+            max_age_days=int(os.environ.get("BJ_RETENTION_DAYS", 30)),
+            interval_seconds=float(os.environ.get("BJ_RETENTION_INTERVAL", 3600)),
+            chunk_size=int(os.environ.get("BJ_RETENTION_CHUNK", 1000)),
+            archive_db=os.environ.get("BJ_RETENTION_ARCHIVE") or None,
+            vacuum=os.environ.get("BJ_RETENTION_VACUUM", "0") == "1",
+        )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        # 每 interval_seconds 一次；啟動時不立刻跑，避免和快取預熱讀取 action_logs 搶資源
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    def run_once(self) -> dict:
+        started = time.time()
+        try:
+            result = database.rollup_action_logs(
+                max_age_days=self.max_age_days, chunk_size=self.chunk_size, archive_db=self.archive_db)
+            database.compact_db(vacuum=self.vacuum)
+            result["seconds"] = time.time() - started
+            error = None
+        except Exception as e:
+            result, error = None, repr(e)
+        with self._lock:
+            self.runs += 1
+            self.last_run = started
+            self.last_result = result
+            self.error = error
+        return result
+
+    def status(self) -> dict:
+        with self._lock:
+            status = {
+                "max_age_days": self.max_age_days,
+                "interval_seconds": self.interval_seconds,
+                "archive_db": self.archive_db,
+                "runs": self.runs,
+                "last_run": self.last_run,
+                "last_result": self.last_result,
+                "error": self.error,
+            }
+        status.update(database.get_storage_stats())
+        if os.path.exists(database.DB_NAME):
+            status["db_bytes"] = os.path.getsize(database.DB_NAME)
+        return status
+
+
+if __name__ == "__main__":
+
+    # 手動執行一次：python Retention.py（舊資料庫沒有 action_rollups，先跑 init_db 建表）
+    database.init_db()
+    scheduler = RetentionScheduler.from_env()
+    result = scheduler.run_once()
+    if result is None:
+        print("error: {}".format(scheduler.error))
+        raise SystemExit(1)
+    print(result)
@@ -7,7 +7,7 @@ import os, sys
 sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
 
 import random
-from typing import Dict
+from typing import Dict, List, Tuple
 
 from Utils import *
 
@@ -95,6 +95,136 @@ class Shoe():
         return shoe_temp
     
 
+"""
+========================================================================================================================
+Physical Shoe (shuffled once, dealt by index)
+========================================================================================================================
+"""
+class PhysicalShoe(Shoe):
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, num_decks: int = 6, seed: int = None) -> None:
+
+        # The seed alone reproduces the whole deal order
+        self.seed = seed if seed is not None else random.SystemRandom().randint(0, 2**31-1)
+        super().__init__(num_decks, rng = random.Random(self.seed))
+
+        # One byte per card, shuffled once; counts are kept in step with the dealing index
+        self.cards = bytearray(rank for rank in RANKS for _ in range(4 * num_decks))
+        self.rng.shuffle(self.cards)
+        self.pos = 0
+
+        return
+
+    """
+    ====================================================================================================================
+    Number of Remaining Cards
+    ====================================================================================================================
+    """
+    def remaining(self) -> int:
+
+        return len(self.cards) - self.pos
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def remove_card(self, rank: Rank) -> None:
+
+        # Check Validity
+        if self.counts.get(rank, 0) <= 0:
+            raise ValueError("No card {} left to remove".format(rank))
+
+        # Pull the next card of that rank forward, then deal it
+        j = self.cards.index(rank, self.pos)
+        self.cards[self.pos], self.cards[j] = self.cards[j], self.cards[self.pos]
+        self.pos += 1
+        self.counts[rank] -= 1
+
+        return
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def draw_one(self) -> Rank:
+
+        if self.pos >= len(self.cards):
+            raise ValueError("Shoe is empty")
+
+        rank = self.cards[self.pos]
+        self.pos += 1
+        self.counts[rank] -= 1
+
+        return rank
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def clone(self) -> Shoe:
+
+        # Simulations get the composition only, never the upcoming order
+        shoe_temp = Shoe(self.num_decks, rng = random.Random(self.rng.randint(0, 2**31-1)))
+        shoe_temp.counts = dict(self.counts)
+
+        return shoe_temp
+
+
+"""
+========================================================================================================================
+Tracing Shoe (records every draw, shared across clones)
+========================================================================================================================
+"""
+class TracingShoe(Shoe):
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, num_decks: int = 6, rng: random.Random = None, trace: List[Tuple[Rank, int, int]] = None) -> None:
+
+        super().__init__(num_decks, rng)
+
+        # (rank drawn, count of that rank before the draw, cards left before the draw)
+        self.trace = trace if trace is not None else []
+
+        return
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def draw_one(self) -> Rank:
+
+        total = self.remaining()
+        rank = super().draw_one()
+        self.trace.append((rank, self.counts[rank] + 1, total))
+
+        return rank
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def clone(self) -> 'TracingShoe':
+
+        shoe_temp = TracingShoe(self.num_decks, rng = random.Random(self.rng.randint(0, 2**31-1)), trace = self.trace)
+        shoe_temp.counts = dict(self.counts)
+
+        return shoe_temp
+
+
 """
 ========================================================================================================================
 Main Function
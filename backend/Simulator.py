@@ -10,9 +10,10 @@ import random
 import math
 from typing import List, Dict
 
-from Shoe import Shoe
+from Shoe import Shoe, TracingShoe
 from Hand import Hand
 from Game import *
+from Stats import PayoffAccumulator, percentiles_from_fractions
 from Utils import *
 
 
@@ -28,7 +29,8 @@ class Simulator():
     Initialization
     ====================================================================================================================
     """
-    def __init__(self, base_shoe: Shoe, num_sim: int = 10000, blackjack_payout: float = 1.5, rng_seed: int = None) -> None:
+    def __init__(self, base_shoe: Shoe, num_sim: int = 10000, blackjack_payout: float = 1.5, rng_seed: int = None,
+                 sampling: str = 'plain', allocation: str = 'proportional') -> None:
 
         self.base_shoe = base_shoe
 
@@ -36,6 +38,10 @@ class Simulator():
         self.blackjack_payout = blackjack_payout
         self.rng = random.Random(rng_seed)
 
+        # 'plain' Monte Carlo or 'stratified' over (dealer hole card, player's next card)
+        self.sampling = sampling
+        self.allocation = allocation
+
         return
 
     """
@@ -46,8 +52,9 @@ class Simulator():
     # Simulator.py の _prepare_shoe_from_state メソッド内
 
     def _prepare_shoe_from_state(self, player_cards: List[Rank], dealer_cards: List[Rank]) -> Shoe:
-        # Clone Shoe
+        # Clone Shoe (draws come from the simulator's rng, so rng_seed reproduces the run)
         shoe = self.base_shoe.clone()
+        shoe.rng = self.rng
 
         # Remove Player's Cards
         #for card in player_cards[:]:
@@ -69,95 +76,172 @@ class Simulator():
     
     ====================================================================================================================
     """
-    def simulate_action(self, player_cards: List[Rank], dealer_cards: List[Rank], action: str) -> Dict:
+    def _play_trial(self, shoe: Shoe, player_cards: List[Rank], dealer_cards: List[Rank], action: str, forced: List[Rank] = None) -> float:
+
+        # Forced cards are dealt before the shoe is touched (dealer hole card, then player's first draw)
+        forced = list(forced or [])
+        def draw() -> Rank:
+            return forced.pop(0) if forced else shoe.draw_one()
+
+        # 
+        player_hand = Hand(player_cards[:])
+        dealer_hand = Hand(dealer_cards[:] + [draw()])
+
+        # 
+        if action == 'STAND':
+            final_player_hand = player_hand
+
+        elif action == 'HIT':
+            while True:
+                # Hit
+                player_hand.add_card(draw())
+                # Settle
+                dealer_play(shoe.clone(), dealer_hand)
+                payoff = settle_hand(player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
+                if player_hand.is_bust() or payoff > 0:
+                    return payoff
+
+        elif action == 'DOUBLE':
+            player_hand.doubled = True
+            player_hand.add_card(draw())
+            final_player_hand = player_hand
+
+        # 
+        dealer_play(shoe, dealer_hand)
+
+        # 
+        return settle_hand(final_player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
+
+    """
+    ====================================================================================================================
+    
+    ====================================================================================================================
+    """
+    def simulate_action(self, player_cards: List[Rank], dealer_cards: List[Rank], action: str, num_sim: int = None) -> Dict:
 
-        payoffs = []
-        for _ in range(self.num_sim):
+        # Constant memory: running moments, outcome counts and a payoff histogram
+        acc = PayoffAccumulator()
+        for _ in range(num_sim or self.num_sim):
 
             # 
             shoe = self._prepare_shoe_from_state(player_cards[:], dealer_cards[:])
+            acc.add(self._play_trial(shoe, player_cards, dealer_cards, action))
 
-            # 
-            player_hand = Hand(player_cards[:])
-            dealer_hand = Hand(dealer_cards[:] + [shoe.draw_one()])
+        return acc.to_result(action)
 
-            # 
+    """
+    ====================================================================================================================
+    Stratified Sampling over the First Draws
+    ====================================================================================================================
+    """
+    def _strata(self, action: str) -> List[tuple]:
+
+        # Ten-valued ranks are interchangeable for play, so strata are card values (1 = Ace, 10 = T/J/Q/K)
+        counts = self.base_shoe.counts
+        by_value = {v: sum(c for r, c in counts.items() if RANK_TO_VALUE[r] == v) for v in range(1, 11)}
+        total = sum(by_value.values())
+
+        strata = []
+        for hole, c_hole in by_value.items():
+            if c_hole == 0:
+                continue
+            w_hole = c_hole / total
+
+            # Standing draws nothing for the player: the hole card alone decides the stratum
             if action == 'STAND':
-                final_player_hand = player_hand
+                strata.append(((hole,), w_hole))
+                continue
 
-            elif action == 'HIT':
+            for first, c_first in by_value.items():
+                c_first -= (first == hole)
+                if c_first > 0:
+                    strata.append(((hole, first), w_hole * c_first / (total - 1)))
 
-                """
-                # Hit
-                player_hand.add_card(shoe.draw_one())
+        return strata
 
-                # Settle
-                dealer_play(shoe.clone(), dealer_hand)
-                payoff = settle_hand(player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
-                if player_hand.is_bust() or payoff > 0 or len(player_hand) >= 5:
-                    payoffs.append(payoff)
-                    continue
+    def _stratum_shoe(self, values: tuple) -> tuple:
 
-                # Hit
-                player_hand.add_card(shoe.draw_one())
+        # Remove one concrete rank per forced value (the most plentiful ten-rank stands in for value 10)
+        shoe = self._prepare_shoe_from_state([], [])
+        forced = []
+        for v in values:
+            rank = v if v < 10 else max((10, 11, 12, 13), key = lambda r: shoe.counts[r])
+            shoe.remove_card(rank)
+            forced.append(rank)
 
-                # Settle
-                dealer_play(shoe.clone(), dealer_hand)
-                payoff = settle_hand(player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
-                if player_hand.is_bust() or payoff > 0 or len(player_hand) >= 5:
-                    payoffs.append(payoff)
-                    continue
-                    
-                # Hit
-                player_hand.add_card(shoe.draw_one())
+        return shoe, forced
 
-                # Settle
-                dealer_play(shoe.clone(), dealer_hand)
-                payoff = settle_hand(player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
-                if player_hand.is_bust() or payoff > 0 or len(player_hand) >= 5:
-                    payoffs.append(payoff)
-                    continue
-                
-                """
-                while True:
-                    # Hit
-                    player_hand.add_card(shoe.draw_one())
-                    # Settle
-                    dealer_play(shoe.clone(), dealer_hand)
-                    payoff = settle_hand(player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
-                    if player_hand.is_bust() or payoff > 0:
-                        payoffs.append(payoff)
-                        break
-                continue
-            
-            elif action == 'DOUBLE':
-                player_hand.doubled = True
-                player_hand.add_card(shoe.draw_one())
-                final_player_hand = player_hand
+    def _sample_stratum(self, acc: PayoffAccumulator, values: tuple, n: int, player_cards: List[Rank], dealer_cards: List[Rank], action: str) -> None:
 
-            # 
-            dealer_play(shoe, dealer_hand)
+        for _ in range(n):
+            shoe, forced = self._stratum_shoe(values)
+            acc.add(self._play_trial(shoe, player_cards, dealer_cards, action, forced = forced))
 
-            # 
-            payoff = settle_hand(final_player_hand, dealer_hand, blackjack_payout = self.blackjack_payout)
-            payoffs.append(payoff)
+        return
 
-        # 
-        n = len(payoffs)
-        mean = sum(payoffs) / n if n else 0.0
-        wins = sum(1 for p in payoffs if p > 0)
-        losses = sum(1 for p in payoffs if p < 0)
-        pushes = n - wins - losses
-        var = sum((p - mean) ** 2 for p in payoffs) / n if n else 0.0
+    def simulate_action_stratified(self, player_cards: List[Rank], dealer_cards: List[Rank], action: str, allocation: str = None, num_sim: int = None) -> Dict:
+
+        num_sim = num_sim or self.num_sim
+        allocation = allocation or self.allocation
+        strata = self._strata(action)
+        stats = {values: PayoffAccumulator() for values, _ in strata}
+        if allocation not in ('neyman', 'proportional'):
+            raise ValueError("Unknown allocation {}".format(allocation))
+
+        # Too small a budget to give every stratum a real share: plain Monte Carlo with exactly num_sim trials
+        if num_sim < 8 * len(strata):
+            result = self.simulate_action(player_cards, dealer_cards, action, num_sim = num_sim)
+            result['strata'] = 1
+            result['allocation'] = 'plain'
+            return result
+
+        # Every stratum needs two samples for a variance estimate; the floors come out of the budget
+        floor = 2 * len(strata)
+        if allocation == 'neyman':
+            # Pilot with a proportional slice of the budget; its sizes are fixed in advance, so it can be kept
+            pilot = {values: PayoffAccumulator() for values, _ in strata}
+            pilot_budget = max(num_sim // 5, floor) - floor
+            for values, w in strata:
+                self._sample_stratum(pilot[values], values, 2 + round(pilot_budget * w), player_cards, dealer_cards, action)
+
+            # Tiny pilots often see no spread at all; floor sigma_h at a fraction of the pooled sigma
+            pooled = sum(w * pilot[values].sample_variance() for values, w in strata)
+            remaining = max(0, num_sim - sum(acc.n for acc in pilot.values()) - floor)
+            scores = {values: w * math.sqrt(max(pilot[values].sample_variance(), 0.05 * pooled)) for values, w in strata}
+            norm = sum(scores.values())
+            for values, w in strata:
+                share = scores[values] / norm if norm > 0 else w
+                self._sample_stratum(stats[values], values, 2 + round(remaining * share), player_cards, dealer_cards, action)
+                stats[values].merge(pilot[values])
+
+        else:
+            for values, w in strata:
+                self._sample_stratum(stats[values], values, 2 + round((num_sim - floor) * w), player_cards, dealer_cards, action)
+
+        # Combine: the estimator variance only carries the within-stratum spread
+        n = sum(acc.n for acc in stats.values())
+        mean = sum(w * stats[v].mean for v, w in strata)
+        wins = sum(w * stats[v].wins / stats[v].n for v, w in strata)
+        losses = sum(w * stats[v].losses / stats[v].n for v, w in strata)
+        var_mean = sum(w * w * stats[v].sample_variance() / stats[v].n for v, w in strata)
+
+        # Payoff distribution is the weighted mixture of the stratum histograms
+        any_acc = stats[strata[0][0]]
+        mixture = [sum(w * stats[v].fractions()[k] for v, w in strata) for k in range(len(any_acc.bins))]
 
         return {
             'action': action,
             'n': n,
             'ev': mean,
-            'win_rate': wins / n,
-            'loss_rate': losses / n,
-            'push_rate': pushes / n,
-            'stddev': math.sqrt(var)
+            'win_rate': wins,
+            'loss_rate': losses,
+            'push_rate': 1.0 - wins - losses,
+            # Per-trial spread equivalent to the stratified estimator (stddev / sqrt(n) == stderr)
+            'stddev': math.sqrt(var_mean * n),
+            'stderr': math.sqrt(var_mean),
+            'percentiles': percentiles_from_fractions(mixture, any_acc.lo, any_acc.width),
+            'strata': len(strata),
+            'allocation': allocation
         }
 
     """
@@ -165,7 +249,7 @@ class Simulator():
     
     ====================================================================================================================
     """
-    def evaluate_all(self, player_cards: List[Rank], dealer_cards: List[Rank]) -> Dict:
+    def _actions(self, player_cards: List[Rank]) -> List[str]:
 
         actions = ['STAND']
 
@@ -175,9 +259,16 @@ class Simulator():
         if len(player_cards) == 2:
             actions.append('DOUBLE')
 
+        return actions
+
+    def evaluate_all(self, player_cards: List[Rank], dealer_cards: List[Rank], num_sim: int = None) -> Dict:
+
         results = {}
-        for action in actions:
-            results[action] = self.simulate_action(player_cards[:], dealer_cards[:], action)
+        for action in self._actions(player_cards):
+            if self.sampling == 'stratified':
+                results[action] = self.simulate_action_stratified(player_cards[:], dealer_cards[:], action, num_sim = num_sim)
+            else:
+                results[action] = self.simulate_action(player_cards[:], dealer_cards[:], action, num_sim = num_sim)
 
         # 
         best = max(results.items(), key = lambda kv: kv[1]['ev'])
@@ -188,6 +279,77 @@ class Simulator():
             'best_action': best[0],
             'best_ev': best[1]['ev']
         }
+
+    """
+    ====================================================================================================================
+    Effect of Removal (one pass, likelihood-ratio reweighting of shared trajectories)
+    ====================================================================================================================
+    """
+    def effect_of_removal(self, player_cards: List[Rank], dealer_cards: List[Rank], num_sim: int = None) -> Dict:
+
+        # Every trajectory is sampled once from the current shoe. Under a shoe with one fewer card of rank r, a draw
+        # of rank d from (c_d of N) has probability (c_d - [d == r]) / (N - 1), so the trajectory is reweighted by
+        # prod N / (N - 1) * prod_{d == r} (c_d - 1) / c_d. All 13 perturbed EVs come from the same samples.
+        num_sim = num_sim or self.num_sim
+        counts = self.base_shoe.counts
+        removable = [r for r in RANKS if counts.get(r, 0) > 0]
+
+        base, perturbed = {}, {r: {} for r in removable}
+        for action in self._actions(player_cards):
+
+            acc = PayoffAccumulator()
+            sum_w = {r: 0.0 for r in removable}
+            sum_wp = {r: 0.0 for r in removable}
+            for _ in range(num_sim):
+
+                shoe = TracingShoe(self.base_shoe.num_decks, rng = random.Random(self.rng.randint(0, 2**31-1)))
+                shoe.counts = dict(counts)
+                payoff = self._play_trial(shoe, player_cards, dealer_cards, action)
+                acc.add(payoff)
+
+                common = 1.0
+                own = {}
+                for rank, c, total in shoe.trace:
+                    common *= total / (total - 1) if total > 1 else 0.0
+                    own[rank] = own.get(rank, 1.0) * (c - 1) / c
+
+                for r in removable:
+                    w = common * own.get(r, 1.0)
+                    sum_w[r] += w
+                    sum_wp[r] += w * payoff
+
+            base[action] = acc.to_result(action)
+            for r in removable:
+                # Self-normalised: a rank drawn in every trajectory of a sparse shoe can leave no weight
+                perturbed[r][action] = sum_wp[r] / sum_w[r] if sum_w[r] > 0 else None
+
+        best_action = max(base, key = lambda a: base[a]['ev'])
+        best_ev = base[best_action]['ev']
+
+        effects = {}
+        for r in RANKS:
+            if r not in perturbed:
+                effects[card_str(r)] = None
+                continue
+            evs = {a: ev for a, ev in perturbed[r].items() if ev is not None}
+            if not evs:
+                effects[card_str(r)] = None
+                continue
+            r_best = max(evs, key = evs.get)
+            effects[card_str(r)] = {
+                'ev_delta': {a: ev - base[a]['ev'] for a, ev in evs.items()},
+                'best_action': r_best,
+                'best_ev_delta': evs[r_best] - best_ev
+            }
+
+        return {
+            'player_hand': [card_str(r) for r in player_cards[:]],
+            'dealer_hand': [card_str(r) for r in dealer_cards[:]],
+            'results': base,
+            'best_action': best_action,
+            'best_ev': best_ev,
+            'effects': effects
+        }
     
 
 """
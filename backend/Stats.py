@@ -0,0 +1,177 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import math
+from typing import Dict, List, Tuple
+
+
+"""
+========================================================================================================================
+Global Variable
+========================================================================================================================
+"""
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+"""
+========================================================================================================================
+Streaming Payoff Accumulator
+========================================================================================================================
+"""
+class PayoffAccumulator():
+
+    """
+    ====================================================================================================================
+    Initialization
+    ====================================================================================================================
+    """
+    def __init__(self, lo: float = -2.0, hi: float = 2.0, width: float = 0.5) -> None:
+
+        # Welford running moments
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # Outcome counters
+        self.wins = 0
+        self.losses = 0
+
+        # Fixed-bin histogram; payoffs are multiples of 0.5 in [-2, 2], so the default bins are exact
+        self.lo = lo
+        self.width = width
+        self.bins = [0] * (int(round((hi - lo) / width)) + 1)
+
+        return
+
+    """
+    ====================================================================================================================
+
+    ====================================================================================================================
+    """
+    def add(self, payoff: float) -> None:
+
+        self.n += 1
+        delta = payoff - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (payoff - self.mean)
+
+        if payoff > 0:
+            self.wins += 1
+        elif payoff < 0:
+            self.losses += 1
+
+        k = int(round((payoff - self.lo) / self.width))
+        self.bins[max(0, min(len(self.bins) - 1, k))] += 1
+
+        return
+
+    """
+    ====================================================================================================================
+    Merge (batches, threads or processes; Chan et al. parallel update)
+    ====================================================================================================================
+    """
+    def merge(self, other: 'PayoffAccumulator') -> 'PayoffAccumulator':
+
+        if (self.lo, self.width, len(self.bins)) != (other.lo, other.width, len(other.bins)):
+            raise ValueError("Cannot merge accumulators with different histogram bins")
+
+        n = self.n + other.n
+        if n:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+            self.mean += delta * other.n / n
+        self.n = n
+
+        self.wins += other.wins
+        self.losses += other.losses
+        self.bins = [a + b for a, b in zip(self.bins, other.bins)]
+
+        return self
+
+    """
+    ====================================================================================================================
+
+    ====================================================================================================================
+    """
+    def variance(self) -> float:
+
+        # Population variance (matches the historical 'stddev' field)
+        return self.m2 / self.n if self.n else 0.0
+
+    def sample_variance(self) -> float:
+
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def stderr(self) -> float:
+
+        return math.sqrt(self.sample_variance() / self.n) if self.n else 0.0
+
+    def fractions(self) -> List[float]:
+
+        return [b / self.n for b in self.bins] if self.n else [0.0] * len(self.bins)
+
+    def percentiles(self, qs: Tuple[int, ...] = PERCENTILES) -> Dict[str, float]:
+
+        return percentiles_from_fractions(self.fractions(), self.lo, self.width, qs)
+
+    """
+    ====================================================================================================================
+
+    ====================================================================================================================
+    """
+    def to_result(self, action: str) -> Dict:
+
+        n = self.n
+        return {
+            'action': action,
+            'n': n,
+            'ev': self.mean,
+            'win_rate': self.wins / n if n else 0.0,
+            'loss_rate': self.losses / n if n else 0.0,
+            'push_rate': (n - self.wins - self.losses) / n if n else 0.0,
+            'stddev': math.sqrt(self.variance()),
+            'stderr': self.stderr(),
+            'percentiles': self.percentiles()
+        }
+
+
+"""
+========================================================================================================================
+Histogram Percentiles
+========================================================================================================================
+"""
+def percentiles_from_fractions(fractions: List[float], lo: float, width: float, qs: Tuple[int, ...] = PERCENTILES) -> Dict[str, float]:
+
+    # Works for a single histogram or a weighted mixture of them (e.g. stratified sampling)
+    result = {}
+    for q in qs:
+        cum = 0.0
+        value = lo + width * (len(fractions) - 1)
+        for k, f in enumerate(fractions):
+            cum += f
+            if cum >= q / 100.0 - 1e-12 and f > 0:
+                value = lo + width * k
+                break
+        result['p{}'.format(q)] = value
+
+    return result
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+if __name__ == "__main__":
+
+    a, b, whole = PayoffAccumulator(), PayoffAccumulator(), PayoffAccumulator()
+    for i, p in enumerate([1, -1, -1, 0, 1.5, -2, 2, 1, -1, 0]):
+        (a if i % 2 else b).add(p)
+        whole.add(p)
+
+    print()
+    print(a.merge(b).to_result('TEST'))
+    print(whole.to_result('TEST'))
+    print()
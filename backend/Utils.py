@@ -3,6 +3,7 @@
 Package
 ========================================================================================================================
 """
+import math
 
 
 """
@@ -22,4 +23,21 @@ def card_str(rank: Rank) -> str:
     if rank == 11: return 'J'
     if rank == 12: return 'Q'
     if rank == 13: return 'K'
-    return str(rank)
\ No newline at end of file
+    return str(rank)
+
+def percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile on a (not necessarily sorted) list, q in [0, 100]
+    if not values: return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def parse_card(text: str) -> Rank:
+    # Inverse of card_str; also accepts the numeric strings written to action_logs ("1", "11".."13")
+    text = str(text).strip().upper()
+    if text == 'A': return 1
+    if text == 'J': return 11
+    if text == 'Q': return 12
+    if text == 'K': return 13
+    return int(text)
@@ -0,0 +1,131 @@
+import os
+import random
+import threading
+import time
+from typing import List
+
+import database
+from Admission import ComputeGate
+from RecommendationCache import ApproxRecommendationCache, default_cache
+from Shoe import Shoe
+from Simulator import Simulator
+from Utils import parse_card
+
+
+class CacheWarmer():
+    """
+    重新部署 / 重啟後每個推薦都是 cache miss。
+    啟動時從 action_logs 找出最常出現的 (手牌, 莊家明牌)，在背景針對常見副數與牌靴前段的組成先算好，
+    寫進近似快取；不阻擋 server ready，每次計算都佔用一個計算名額（保留名額給真實請求，有請求排隊時讓路）。
+    """
+
+    def __init__(self, cache: ApproxRecommendationCache = default_cache, gate: ComputeGate = None,
+                 num_decks_list: List[int] = (1, 2, 6, 8), top_states: int = 100, compositions: int = 2,
+                 max_penetration: float = 0.15, num_sim: int = 5000, seed: int = 0) -> None:
+        self.cache = cache
+        self.gate = gate
+        self.num_decks_list = list(num_decks_list)
+        self.top_states = top_states
+        self.compositions = compositions          # 每個狀態、每種副數要算的牌靴組成數（第 1 組為全新牌靴）
+        self.max_penetration = max_penetration    # 其餘組成隨機燒掉最多這個比例的牌
+        self.num_sim = num_sim
+        self.rng = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self.running = False
+        self.done = 0
+        self.total = 0
+        self.states = 0
+        self.covered_decisions = 0
+        self.logged_decisions = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    @classmethod
+    def from_env(cls, gate: ComputeGate = None) -> 'CacheWarmer':
+        return cls(
+            gate=gate,
+            num_decks_list=[int(x) for x in os.environ.get("BJ_WARMUP_DECKS", "1,2,6,8").split(",") if x.strip()],
+            top_states=int(os.environ.get("BJ_WARMUP_STATES", 100)),
+            compositions=int(os.environ.get("BJ_WARMUP_COMPOSITIONS", 2)),
+            num_sim=int(os.environ.get("BJ_WARMUP_NUM_SIM", 5000)),
+        )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, name="cache-warmup", daemon=True)
+        self._thread.start()
+
+    def _early_shoe(self, num_decks: int, variant: int, cards: List[int]) -> Shoe:
+        shoe = Shoe(num_decks=num_decks, rng=random.Random(self.rng.randint(0, 2**31-1)))
+        if variant > 0:
+            for _ in range(self.rng.randint(1, int(shoe.remaining() * self.max_penetration))):
+                shoe.draw_one()
+        # 與 Manager 相同：畫面上的牌已不在牌靴中
+        for card in cards:
+            if shoe.counts.get(card, 0) > 0:
+                shoe.remove_card(card)
+        return shoe
+
+    def _acquire_slot(self) -> None:
+        # 真實請求優先：每次計算都佔用一個計算名額（與先行發牌相同），沒有空名額就稍後再試
+        while self.gate is not None and not self.gate.try_acquire():
+            time.sleep(0.05)
+
+    def run(self) -> None:
+        with self._lock:
+            self.running = True
+            self.started_at = time.time()
+        try:
+            states, self.logged_decisions = database.get_frequent_states(self.top_states)
+            self.states = len(states)
+            self.total = len(states) * len(self.num_decks_list) * self.compositions
+
+            for state in states:
+                player_cards = [parse_card(c) for c in state["player_hand"]]
+                dealer_cards = [parse_card(state["dealer_upcard"])]
+                if len(player_cards) < 2:
+                    continue
+
+                for num_decks in self.num_decks_list:
+                    for variant in range(self.compositions):
+                        self._acquire_slot()
+                        try:
+                            shoe = self._early_shoe(num_decks, variant, player_cards + dealer_cards)
+                            rec = Simulator(shoe, self.num_sim, rng_seed=self.rng.randint(0, 2**31-1)).evaluate_all(player_cards, dealer_cards)
+                        finally:
+                            if self.gate is not None:
+                                self.gate.release()
+                        self.cache.store(player_cards, dealer_cards, shoe, rec)
+                        with self._lock:
+                            self.done += 1
+
+                with self._lock:
+                    self.covered_decisions += state["count"]
+        except Exception as e:
+            self.error = repr(e)
+        finally:
+            with self._lock:
+                self.running = False
+                self.finished_at = time.time()
+
+    def status(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "running": self.running,
+                "done": self.done,
+                "total": self.total,
+                "progress": self.done / self.total if self.total else (1.0 if self.finished_at else 0.0),
+                "states": self.states,
+                "num_decks": self.num_decks_list,
+                # 已預熱的狀態佔歷史決策的比例
+                "covered_decisions": self.covered_decisions,
+                "logged_decisions": self.logged_decisions,
+                "coverage": self.covered_decisions / self.logged_decisions if self.logged_decisions else 0.0,
+                "elapsed_seconds": end - self.started_at if self.started_at else 0.0,
+                "error": self.error,
+            }
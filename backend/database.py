@@ -1,6 +1,10 @@
 import sqlite3
 import json
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+
+from Hand import Hand
+from Utils import RANK_TO_VALUE, parse_card
 
 DB_NAME = "blackjack.db"
 
@@ -29,7 +33,28 @@ def init_db():
             is_mistake BOOLEAN
         )
     ''')
-    
+
+    # 保存期間を過ぎた生ログの日次集計（手札カテゴリ × 表カード × 選択/推奨アクション）
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS action_rollups (
+            day TEXT,
+            hand_category TEXT,
+            dealer_upcard TEXT,
+            action_taken TEXT,
+            action_recommended TEXT,
+            decisions INTEGER,
+            mistakes INTEGER,
+            PRIMARY KEY (day, hand_category, dealer_upcard, action_taken, action_recommended)
+        )
+    ''')
+
+    # 期間指定の削除とゲーム別のミス検索を速くする
+    c.execute('CREATE INDEX IF NOT EXISTS idx_action_logs_timestamp ON action_logs (timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_action_logs_game_id ON action_logs (game_id)')
+
+    # WAL: 集計・削除中も書き込みをブロックしにくくする
+    c.execute('PRAGMA journal_mode=WAL')
+
     conn.commit()
     conn.close()
 
@@ -74,4 +99,182 @@ def get_all_mistakes(game_id):
             "timestamp": timestamp
         })
     
-    return mistakes
\ No newline at end of file
+    return mistakes
+
+def get_action_logs(game_id=None, limit=None):
+    """記録済みの判断状態を id 順に取得する（リプレイ・分析用）"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+
+    query = '''
+        SELECT id, game_id, timestamp, player_hand, dealer_upcard, action_taken, action_recommended, is_mistake
+        FROM action_logs
+    '''
+    params = []
+    if game_id is not None:
+        query += ' WHERE game_id = ?'
+        params.append(game_id)
+    query += ' ORDER BY id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+
+    c.execute(query, params)
+    results = c.fetchall()
+    conn.close()
+
+    logs = []
+    for row in results:
+        log_id, g_id, timestamp, p_hand_json, d_upcard, taken, recommended, is_mistake = row
+        logs.append({
+            "id": log_id,
+            "game_id": g_id,
+            "timestamp": timestamp,
+            "player_hand": json.loads(p_hand_json) if p_hand_json else [],
+            "dealer_upcard": d_upcard,
+            "action_taken": taken,
+            "action_recommended": recommended,
+            "is_mistake": bool(is_mistake)
+        })
+
+    return logs
+
+def get_frequent_states(limit=100):
+    """出現回数の多い (手札, ディーラー表カード) の判断状態を取得する（キャッシュのウォームアップ用）"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+
+    c.execute('''
+        SELECT player_hand, dealer_upcard, COUNT(*) AS n
+        FROM action_logs
+        WHERE dealer_upcard IS NOT NULL
+        GROUP BY player_hand, dealer_upcard
+        ORDER BY n DESC
+        LIMIT ?
+    ''', (limit,))
+    results = c.fetchall()
+
+    c.execute('SELECT COUNT(*) FROM action_logs')
+    total = c.fetchone()[0]
+    conn.close()
+
+    states = []
+    for p_hand_json, d_upcard, n in results:
+        states.append({
+            "player_hand": json.loads(p_hand_json) if p_hand_json else [],
+            "dealer_upcard": d_upcard,
+            "count": n
+        })
+
+    return states, total
+
+def hand_category(p_hand):
+    """ログの手札を集計用カテゴリ（"pair 8" / "soft 17" / "hard 16"）に変換する"""
+    cards = [parse_card(c) for c in p_hand]
+    if len(cards) == 2 and RANK_TO_VALUE[cards[0]] == RANK_TO_VALUE[cards[1]]:
+        return "pair {}".format("A" if cards[0] == 1 else RANK_TO_VALUE[cards[0]])
+    total, is_soft = Hand(cards).values()
+    return "{} {}".format("soft" if is_soft else "hard", total)
+
+def rollup_action_logs(max_age_days=30, chunk_size=1000, archive_db=None, pause=0.05):
+    """古い生ログを日次集計に畳み込み、チャンク単位で削除（またはアーカイブ）する
+
+    1 チャンク = 1 つの短いトランザクションなので、書き込みロックを長時間握らない。
+    """
+    cutoff = str(datetime.now() - timedelta(days=max_age_days))
+    rolled = 0
+    chunks = 0
+
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    conn.isolation_level = None  # トランザクションは手動で管理
+    c = conn.cursor()
+    if archive_db:
+        c.execute('ATTACH DATABASE ? AS archive', (archive_db,))
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS archive.action_logs (
+                id INTEGER PRIMARY KEY,
+                game_id TEXT,
+                timestamp DATETIME,
+                player_hand TEXT,
+                dealer_upcard TEXT,
+                action_taken TEXT,
+                action_recommended TEXT,
+                is_mistake BOOLEAN
+            )
+        ''')
+
+    try:
+        while True:
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('''
+                SELECT id, timestamp, player_hand, dealer_upcard, action_taken, action_recommended, is_mistake
+                FROM action_logs
+                WHERE timestamp < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (cutoff, chunk_size))
+            rows = c.fetchall()
+            if not rows:
+                c.execute('COMMIT')
+                break
+
+            rollups = {}
+            for _, timestamp, p_hand_json, d_upcard, taken, recommended, is_mistake in rows:
+                p_hand = json.loads(p_hand_json) if p_hand_json else []
+                key = (str(timestamp)[:10], hand_category(p_hand) if p_hand else "unknown", d_upcard, taken, recommended)
+                decisions, mistakes = rollups.get(key, (0, 0))
+                rollups[key] = (decisions + 1, mistakes + (1 if is_mistake else 0))
+
+            c.executemany('''
+                INSERT INTO action_rollups (day, hand_category, dealer_upcard, action_taken, action_recommended, decisions, mistakes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (day, hand_category, dealer_upcard, action_taken, action_recommended)
+                DO UPDATE SET decisions = decisions + excluded.decisions, mistakes = mistakes + excluded.mistakes
+            ''', [key + value for key, value in rollups.items()])
+
+            # このチャンクの行 = id 範囲内で cutoff より古い行
+            chunk = (rows[0][0], rows[-1][0], cutoff)
+            if archive_db:
+                c.execute('''
+                    INSERT OR IGNORE INTO archive.action_logs
+                    SELECT * FROM main.action_logs WHERE id BETWEEN ? AND ? AND timestamp < ?
+                ''', chunk)
+            c.execute('DELETE FROM action_logs WHERE id BETWEEN ? AND ? AND timestamp < ?', chunk)
+            c.execute('COMMIT')
+
+            rolled += len(rows)
+            chunks += 1
+            time.sleep(pause)  # 他の書き込みに順番を譲る
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    return {"rolled_up": rolled, "chunks": chunks, "cutoff": cutoff}
+
+def compact_db(vacuum=False):
+    """WAL をチェックポイントして切り詰める（vacuum=True なら VACUUM も実行）"""
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    if vacuum:
+        conn.execute('VACUUM')
+    conn.close()
+
+def get_storage_stats():
+    """生ログと日次集計の行数"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), MIN(timestamp) FROM action_logs')
+    raw_rows, oldest = c.fetchone()
+    c.execute('SELECT COUNT(*), COALESCE(SUM(decisions), 0) FROM action_rollups')
+    rollup_rows, rolled_decisions = c.fetchone()
+    conn.close()
+
+    return {
+        "raw_rows": raw_rows,
+        "oldest_raw": oldest,
+        "rollup_rows": rollup_rows,
+        "rolled_up_decisions": rolled_decisions
+    }
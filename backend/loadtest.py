@@ -0,0 +1,349 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
+
+import http.client
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import click
+
+from Utils import percentile
+
+
+"""
+========================================================================================================================
+Transports
+========================================================================================================================
+"""
+class HttpTransport():
+
+    """
+    Talks to a running uvicorn instance over plain HTTP (stdlib only)
+    """
+    def __init__(self, base_url: str, timeout: float = 60.0) -> None:
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+        return
+
+    def request(self, method: str, path: str, body: Dict = None) -> Tuple[int, Dict]:
+
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data = data, method = method,
+                                     headers = {'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout = self.timeout) as resp:
+                return resp.status, json.loads(resp.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+        except (OSError, http.client.HTTPException):
+            # Refused / reset / timed out: no HTTP status at all, recorded as status 0
+            return 0, None
+
+
+class InProcessTransport():
+
+    """
+    Drives the ASGI app in-process through Starlette's TestClient (sync handlers still run in the thread pool)
+    """
+    def __init__(self, client) -> None:
+
+        self.client = client
+
+        return
+
+    def request(self, method: str, path: str, body: Dict = None) -> Tuple[int, Dict]:
+
+        resp = self.client.request(method, path, json = body)
+        try:
+            payload = resp.json()
+        except ValueError:
+            payload = None
+        return resp.status_code, payload
+
+
+"""
+========================================================================================================================
+Metrics
+========================================================================================================================
+"""
+class Metrics():
+
+    def __init__(self) -> None:
+
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+        # SQLite contention (only observable in-process)
+        self.db_writes: List[float] = []
+        self.db_locked = 0
+
+        return
+
+    def record(self, endpoint: str, seconds: float, status: int) -> None:
+
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if status == 0 or status >= 400:
+                self.errors[endpoint][status] += 1
+
+        return
+
+    def record_db(self, seconds: float, locked: bool) -> None:
+
+        with self.lock:
+            self.db_writes.append(seconds)
+            if locked:
+                self.db_locked += 1
+
+        return
+
+
+"""
+========================================================================================================================
+Simulated Player
+========================================================================================================================
+"""
+def timed(transport, metrics: Metrics, endpoint: str, method: str, path: str, body: Dict = None) -> Tuple[int, Dict]:
+
+    start = time.perf_counter()
+    status, payload = transport.request(method, path, body)
+    metrics.record(endpoint, time.perf_counter() - start, status)
+
+    return status, payload
+
+
+def play(transport, metrics: Metrics, rounds: int, num_decks: int, analysis_prob: float, seed: int) -> None:
+
+    rng = random.Random(seed)
+
+    def new_game():
+        status, state = timed(transport, metrics, 'POST /api/games', 'POST', '/api/games', {'num_decks': num_decks})
+        return state if status == 200 else None
+
+    state = new_game()
+    for _ in range(rounds):
+
+        if state is None:
+            return
+        game_id = state['game_id']
+
+        # Decisions
+        while not state['is_over']:
+
+            if rng.random() < analysis_prob:
+                timed(transport, metrics, 'GET /api/games/{id}/analysis', 'GET', '/api/games/{}/analysis'.format(game_id))
+
+            choices = ['hit', 'stand'] + (['double'] if len(state['player_hand']) == 2 else [])
+            status, payload = timed(transport, metrics, 'POST /api/games/{id}/action', 'POST',
+                                    '/api/games/{}/action'.format(game_id), {'action': rng.choice(choices)})
+            if status != 200:
+                break
+            state = payload
+
+        # Next Round or Fresh Shoe
+        if state.get('can_start_next_round'):
+            status, payload = timed(transport, metrics, 'POST /api/games/{id}/next-round', 'POST',
+                                    '/api/games/{}/next-round'.format(game_id))
+            state = payload if status == 200 else new_game()
+        else:
+            state = new_game()
+
+    return
+
+
+"""
+========================================================================================================================
+CPU Accounting
+========================================================================================================================
+"""
+def cpu_seconds(pid: int = None) -> float:
+
+    # Own process: covers the in-process server and the client threads
+    if pid is None:
+        return time.process_time()
+
+    # Remote uvicorn on the same host: utime + stime from /proc
+    with open('/proc/{}/stat'.format(pid)) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+"""
+========================================================================================================================
+Report
+========================================================================================================================
+"""
+def build_report(metrics: Metrics, wall: float, cpu: float, players: int, in_process: bool) -> Dict:
+
+    cores = os.cpu_count() or 1
+    total = sum(len(v) for v in metrics.latencies.values())
+
+    endpoints = {}
+    for endpoint, values in sorted(metrics.latencies.items()):
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'throughput': len(values) / wall if wall else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': max(values) * 1000,
+            'errors': dict(metrics.errors.get(endpoint, {}))
+        }
+
+    report = {
+        'players': players,
+        'wall_seconds': wall,
+        'requests': total,
+        'throughput': total / wall if wall else 0.0,
+        'endpoints': endpoints,
+        'cpu': {
+            'seconds': cpu,
+            'cores_busy': cpu / wall if wall else 0.0,
+            'saturation': cpu / (wall * cores) if wall else 0.0,
+            'cores': cores
+        }
+    }
+
+    if in_process:
+        writes = metrics.db_writes
+        report['sqlite'] = {
+            'writes': len(writes),
+            'p50_ms': percentile(writes, 50) * 1000,
+            'p99_ms': percentile(writes, 99) * 1000,
+            'max_ms': max(writes) * 1000 if writes else 0.0,
+            'locked_errors': metrics.db_locked,
+            'busy_fraction': sum(writes) / wall if wall else 0.0
+        }
+
+    return report
+
+
+def print_report(report: Dict) -> None:
+
+    click.echo()
+    click.echo('players={players}  requests={requests}  wall={wall_seconds:.1f}s  throughput={throughput:.1f} req/s'.format(**report))
+    click.echo()
+    click.echo('{:<36} {:>8} {:>9} {:>9} {:>9} {:>9}  {}'.format('endpoint', 'n', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for endpoint, s in report['endpoints'].items():
+        click.echo('{:<36} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}  {}'.format(
+            endpoint, s['requests'], s['throughput'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['errors'] or ''))
+    click.echo()
+    click.echo('cpu: {seconds:.1f}s  cores busy={cores_busy:.2f}/{cores}  saturation={saturation:.0%}'.format(**report['cpu']))
+    if 'sqlite' in report:
+        click.echo('sqlite: writes={writes}  p50={p50_ms:.2f}ms  p99={p99_ms:.2f}ms  max={max_ms:.1f}ms  '
+                   'locked={locked_errors}  busy={busy_fraction:.1%}'.format(**report['sqlite']))
+    click.echo()
+
+    return
+
+
+"""
+========================================================================================================================
+Runner
+========================================================================================================================
+"""
+def run_players(transport, metrics: Metrics, players: int, rounds: int, num_decks: int, analysis_prob: float, seed: int) -> float:
+
+    threads = [
+        threading.Thread(target = play, args = (transport, metrics, rounds, num_decks, analysis_prob, seed + i), daemon = True)
+        for i in range(players)
+    ]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return time.perf_counter() - start
+
+
+def instrument_database(database, metrics: Metrics) -> None:
+
+    log_action = database.log_action
+
+    def timed_log_action(*args, **kwargs):
+        start = time.perf_counter()
+        locked = False
+        try:
+            return log_action(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            locked = 'locked' in str(e)
+            raise
+        finally:
+            metrics.record_db(time.perf_counter() - start, locked)
+
+    database.log_action = timed_log_action
+
+    return
+
+
+@click.command()
+@click.option('--players', default = 16, show_default = True, help = 'Concurrent simulated players.')
+@click.option('--rounds', default = 10, show_default = True, help = 'Rounds played by each player.')
+@click.option('--num-decks', default = 6, show_default = True)
+@click.option('--analysis-prob', default = 0.5, show_default = True, help = 'Chance of polling /analysis before a decision.')
+@click.option('--url', default = None, help = 'Target a running server instead of the in-process app.')
+@click.option('--server-pid', default = None, type = int, help = 'PID of the target uvicorn, for CPU accounting with --url.')
+@click.option('--db', default = None, help = 'SQLite file for the in-process run (default: a temporary file).')
+@click.option('--seed', default = 0, show_default = True)
+@click.option('--json-out', default = None, help = 'Also write the report as JSON.')
+def main(players, rounds, num_decks, analysis_prob, url, server_pid, db, seed, json_out):
+
+    metrics = Metrics()
+
+    if url:
+        transport = HttpTransport(url)
+        cpu_before = cpu_seconds(server_pid) if server_pid else None
+        wall = run_players(transport, metrics, players, rounds, num_decks, analysis_prob, seed)
+        cpu = cpu_seconds(server_pid) - cpu_before if server_pid else 0.0
+        report = build_report(metrics, wall, cpu, players, in_process = False)
+
+    else:
+        from fastapi.testclient import TestClient
+        import database
+        import main as app_module
+
+        # Never load-test against the real blackjack.db
+        database.DB_NAME = db or os.path.join(tempfile.mkdtemp(prefix = 'bj-load-'), 'blackjack.db')
+        instrument_database(database, metrics)
+
+        with TestClient(app_module.app) as client:
+            transport = InProcessTransport(client)
+            cpu_before = cpu_seconds()
+            wall = run_players(transport, metrics, players, rounds, num_decks, analysis_prob, seed)
+            cpu = cpu_seconds() - cpu_before
+        report = build_report(metrics, wall, cpu, players, in_process = True)
+
+    print_report(report)
+    if json_out:
+        with open(json_out, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+    return
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+if __name__ == "__main__":
+
+    main()
@@ -1,11 +1,21 @@
+import asyncio
+import json
+import os
 import uuid
-from typing import Dict
-from fastapi import FastAPI, HTTPException
+from typing import Dict, Optional
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 # Import local modules
 from Manager import Manager
+from Admission import ComputeGate, Overloaded
+from RecommendationCache import default_cache
+from Warmup import CacheWarmer
+from Retention import RetentionScheduler
+from Drill import DrillPool
+from DecisionLog import DecisionLogWriter
 import database  # <--- NEW: データベース機能を読み込み
 
 app = FastAPI()
@@ -27,16 +37,48 @@ app.add_middleware(
 def startup_event():
     """サーバー起動時にデータベースを準備する"""
     database.init_db()
+    # 背景で近似キャッシュを予熱する（起動は待たない、BJ_WARMUP=0 で無効）
+    if os.environ.get("BJ_WARMUP", "1") != "0":
+        cache_warmer.start()
+    # 古い生ログの日次集計・削除を定期実行する（BJ_RETENTION=0 で無効）
+    if os.environ.get("BJ_RETENTION", "1") != "0":
+        retention.start()
+    # 事前生成したドリル問題（python Drill.py generate）があれば読み込む
+    global drill_pool
+    pool_path = os.environ.get("BJ_DRILL_POOL", "drill_pool.bin")
+    if os.path.exists(pool_path):
+        drill_pool = DrillPool(pool_path)
 
 
 # --- 1. In-memory Game Storage ---
 games: Dict[str, Manager] = {}
 
+# 推薦計算的併發上限與負載降級（設定見 Admission.ComputeGate.from_env）
+compute_gate = ComputeGate.from_env()
+
+# 啟動時從 action_logs 預熱近似快取（設定見 Warmup.CacheWarmer.from_env）
+cache_warmer = CacheWarmer.from_env(gate=compute_gate)
+
+# action_logs 的保存期限、彙總與壓縮排程（設定見 Retention.RetentionScheduler.from_env）
+retention = RetentionScheduler.from_env()
+
+# 回合結束後先行發下一局並在背景計算推薦（BJ_SPECULATIVE_DEAL=0 停用）
+speculative_deal = os.environ.get("BJ_SPECULATIVE_DEAL", "1") != "0"
+
+# 決策紀錄後端：BJ_LOG_BACKEND=sqlite（預設，database.log_action）或 binary（分段的定長二進位檔，見 DecisionLog.py）
+decision_log = DecisionLogWriter(os.environ.get("BJ_LOG_DIR", "decision_logs")) \
+    if os.environ.get("BJ_LOG_BACKEND", "sqlite") == "binary" else None
+
+# 快問快答練習題庫（啟動時讀入，沒有檔案則為 None）
+drill_pool: Optional[DrillPool] = None
+
 # --- 2. Data Models (Pydantic) ---
 
 
 class CreateGameRequest(BaseModel):
     num_decks: int
+    shoe_mode: str = "random"       # "random" | "physical"
+    seed: Optional[int] = None      # physical 模式的洗牌 seed（重現 session 用）
 
 
 class ActionRequest(BaseModel):
@@ -66,7 +108,7 @@ def format_game_state(game_id: str, gm: Manager, mistakes: list = None):
             result_str = "push"
 
     # --- 計算ロジック ---
-    remaining = gm.shoe.remaining()
+    remaining = gm.visible_remaining()
     initial = gm.initial_shoe_size
     shoe_ratio = remaining / initial if initial > 0 else 0
 
@@ -120,48 +162,64 @@ def format_game_state(game_id: str, gm: Manager, mistakes: list = None):
         "can_start_next_round": gm.finish and not session_completed,
         "actions_taken": gm.actions_taken,  # アクション履歴
         "shoe_composition": shoe_comp,     # カードカウンティング情報
+        "shoe_mode": gm.shoe_mode,
+        "shoe_seed": gm.shoe_seed(),       # physical 模式：以相同 seed 建立遊戲即可重現
         "mistakes": final_mistakes,        # 用於訓練摘要（所有錯誤）
         "round_mistakes": round_mistakes   # 用於本局檢討（當前局的錯誤）
     }
 
-# --- 4. API Endpoints ---
-
-
-@app.post("/api/games")
-def start_game(request: CreateGameRequest):
-    """Start a new game"""
-    game_id = str(uuid.uuid4())
-    gm = Manager(num_decks=request.num_decks)
-    gm.start_round()
-    gm.deal_initial()
-    games[game_id] = gm
-    return format_game_state(game_id, gm)
-
-
-@app.get("/api/games/{game_id}")
-def get_game_state(game_id: str):
-    """Get current game state"""
-    if game_id not in games:
-        raise HTTPException(status_code=404, detail="Game not found")
-    gm = games[game_id]
-    return format_game_state(game_id, gm)
-
-
-@app.post("/api/games/{game_id}/action")
-def perform_action(game_id: str, request: ActionRequest):
-    """Perform action and SAVE to database"""
-    if game_id not in games:
-        raise HTTPException(status_code=404, detail="Game not found")
+def gated(gm: Manager, fn):
+    """compute_gate 取得名額後以該品質等級的模擬次數執行 fn(num_sim)，回傳 (結果, quality)；滿載時 503"""
+    try:
+        with compute_gate.admit() as tier:
+            num_sim = max(1, int(gm.simu.num_sim * tier.fraction))
+            result = fn(num_sim)
+    except Overloaded:
+        raise HTTPException(
+            status_code=503, detail="Server is busy, please retry shortly", headers={"Retry-After": "1"})
+    return result, {"tier": tier.name, "num_sim": num_sim}
+
+def recommend(gm: Manager) -> dict:
+    """經過 compute_gate 計算推薦，並附上實際使用的品質等級"""
+    # 同一個決策狀態已算過（analysis 輪詢、WebSocket 預先推送）就直接沿用
+    rec = gm.recall_recommendation()
+    if rec is not None:
+        return rec
+
+    # 近似快取命中時不佔用計算名額
+    key = gm.decision_key()
+    rec = gm.lookup_recommendation()
+    if rec is not None:
+        rec["quality"] = {"tier": "approx-cache", "num_sim": 0}
+        gm.remember_recommendation(rec, key)
+        return rec
+
+    rec, quality = gated(gm, lambda num_sim: gm.get_recommendation(num_sim=num_sim))
+    rec["quality"] = quality
+    gm.remember_recommendation(rec, key)
+    return rec
+
+
+def format_analysis(rec: dict) -> dict:
+    evaluations = {}
+    for action, stats in rec["results"].items():
+        evaluations[action.lower()] = stats
+    return {
+        "best_action": rec["best_action"].lower(),
+        "evaluations": evaluations,
+        "quality": rec["quality"]
+    }
 
-    gm = games[game_id]
 
+def apply_action(game_id: str, gm: Manager, action: str):
+    """評分、寫入資料庫並更新遊戲（HTTP 與 WebSocket 共用），回傳 (state, rec, mistakes)"""
     if gm.finish:
         raise HTTPException(status_code=400, detail="Round is already over")
 
     # 1. Logic & Calculation
-    rec = gm.get_recommendation()
+    rec = recommend(gm)
     best_action = rec["best_action"]
-    user_action = request.action.upper()
+    user_action = action.upper()
 
     # Mistake check
     is_mistake = (user_action != best_action)
@@ -190,7 +248,8 @@ def perform_action(game_id: str, request: ActionRequest):
         gm.all_mistakes.append(mistake_record)
 
     # <--- NEW: Save to Database --->
-    database.log_action(
+    log_action = decision_log.log_action if decision_log is not None else database.log_action
+    log_action(
         game_id=game_id,
         p_hand=current_p_hand,
         d_upcard=current_d_upcard,
@@ -209,18 +268,15 @@ def perform_action(game_id: str, request: ActionRequest):
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
 
-    return format_game_state(game_id, gm, mistakes=mistakes)
+    state = format_game_state(game_id, gm, mistakes=mistakes)
+    state["recommendation_quality"] = rec["quality"]
+    return state, rec, mistakes
 
 
-@app.post("/api/games/{game_id}/next-round")
-def next_round(game_id: str):
-    """Proceed to the next round"""
-    if game_id not in games:
-        raise HTTPException(status_code=404, detail="Game not found")
-    gm = games[game_id]
+def advance_round(game_id: str, gm: Manager) -> dict:
     if not gm.finish:
         raise HTTPException(status_code=400, detail="Round is not over yet")
-    remaining = gm.shoe.remaining()
+    remaining = gm.visible_remaining()
     if remaining <= gm.stop_threshold:
         raise HTTPException(
             status_code=400, detail="Session completed. Please start a new game.")
@@ -228,6 +284,51 @@ def next_round(game_id: str):
     gm.deal_initial()
     return format_game_state(game_id, gm)
 
+# --- 4. API Endpoints ---
+
+
+@app.post("/api/games")
+def start_game(request: CreateGameRequest):
+    """Start a new game"""
+    game_id = str(uuid.uuid4())
+    try:
+        gm = Manager(num_decks=request.num_decks, shoe_mode=request.shoe_mode, seed=request.seed,
+                     speculative=speculative_deal, gate=compute_gate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    gm.start_round()
+    gm.deal_initial()
+    games[game_id] = gm
+    return format_game_state(game_id, gm)
+
+
+@app.get("/api/games/{game_id}")
+def get_game_state(game_id: str):
+    """Get current game state"""
+    if game_id not in games:
+        raise HTTPException(status_code=404, detail="Game not found")
+    gm = games[game_id]
+    return format_game_state(game_id, gm)
+
+
+@app.post("/api/games/{game_id}/action")
+def perform_action(game_id: str, request: ActionRequest):
+    """Perform action and SAVE to database"""
+    if game_id not in games:
+        raise HTTPException(status_code=404, detail="Game not found")
+    gm = games[game_id]
+    state, _, _ = apply_action(game_id, gm, request.action)
+    return state
+
+
+@app.post("/api/games/{game_id}/next-round")
+def next_round(game_id: str):
+    """Proceed to the next round"""
+    if game_id not in games:
+        raise HTTPException(status_code=404, detail="Game not found")
+    gm = games[game_id]
+    return advance_round(game_id, gm)
+
 
 @app.get("/api/games/{game_id}/analysis")
 def get_analysis(game_id: str):
@@ -235,11 +336,157 @@ def get_analysis(game_id: str):
     if game_id not in games:
         raise HTTPException(status_code=404, detail="Game not found")
     gm = games[game_id]
-    rec = gm.get_recommendation()
-    evaluations = {}
-    for action, stats in rec["results"].items():
-        evaluations[action.lower()] = stats
+    return format_analysis(recommend(gm))
+
+
+@app.get("/api/games/{game_id}/effect-of-removal")
+def get_effect_of_removal(game_id: str):
+    """EV impact of removing one card of each rank from the current shoe, for the current hand"""
+    if game_id not in games:
+        raise HTTPException(status_code=404, detail="Game not found")
+    gm = games[game_id]
+    eor, quality = gated(gm, lambda num_sim: gm.get_effect_of_removal(num_sim=num_sim))
+    effects = {}
+    for rank, effect in eor["effects"].items():
+        effects[rank] = None if effect is None else {
+            "ev_delta": {action.lower(): delta for action, delta in effect["ev_delta"].items()},
+            "best_action": effect["best_action"].lower(),
+            "best_ev_delta": effect["best_ev_delta"]
+        }
     return {
-        "best_action": rec["best_action"].lower(),
-        "evaluations": evaluations
+        "best_action": eor["best_action"].lower(),
+        "best_ev": eor["best_ev"],
+        "effects": effects,
+        "quality": quality
+    }
+
+
+@app.get("/api/admission")
+def get_admission_stats():
+    """Recommendation queue load, quality tier counters and approximate cache hit rate"""
+    stats = compute_gate.stats()
+    stats["approx_cache"] = default_cache.stats()
+    return stats
+
+
+@app.get("/api/warmup")
+def get_warmup_status():
+    """Startup cache warm-up progress and coverage of historical decisions"""
+    status = cache_warmer.status()
+    status["approx_cache"] = default_cache.stats()
+    return status
+
+
+@app.get("/api/retention")
+def get_retention_status():
+    """Action log retention schedule, last rollup run and storage size"""
+    return retention.status()
+
+
+@app.get("/api/drill")
+def get_drill_scenario():
+    """Random pre-generated decision state for rapid-fire drills (no dealing or simulation)"""
+    if drill_pool is None or len(drill_pool) == 0:
+        raise HTTPException(status_code=503, detail="Drill pool not generated (python Drill.py generate)")
+    scenario_id = drill_pool.random_index()
+    rec = drill_pool.record(scenario_id)
+    return {
+        "scenario_id": scenario_id,
+        "player_hand": [str(c) if c != 1 else "A" for c in rec["player_cards"]],
+        "dealer_upcard": str(rec["upcard"]) if rec["upcard"] != 1 else "A",
+        "num_decks": rec["num_decks"],
+        "penetration": rec["penetration"],
+        "available_actions": [action.lower() for action in rec["evs"]]
+    }
+
+
+@app.post("/api/drill/{scenario_id}/answer")
+def answer_drill(scenario_id: int, request: ActionRequest):
+    """Grade a drill answer against the precomputed EVs"""
+    if drill_pool is None:
+        raise HTTPException(status_code=503, detail="Drill pool not generated (python Drill.py generate)")
+    try:
+        result = drill_pool.grade(scenario_id, request.action)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid action")
+    return {
+        "correct": result["correct"],
+        "chosen_action": result["chosen_action"].lower(),
+        "best_action": result["best_action"].lower(),
+        "ev_loss": result["ev_loss"],
+        "evaluations": {action.lower(): ev for action, ev in result["evaluations"].items()}
     }
+
+# --- 5. WebSocket Game Channel ---
+# client -> server: {"type": "action", "action": "hit"} / {"type": "analysis"} / {"type": "next_round"} / {"type": "state"}
+# server -> client: {"type": "state" | "mistake" | "recommendation" | "error", "data": {...}}
+
+
+@app.websocket("/api/games/{game_id}/ws")
+async def game_channel(websocket: WebSocket, game_id: str):
+    """Interactive session over one connection; recommendations are pushed as soon as they are ready"""
+    if game_id not in games:
+        await websocket.close(code=4404)
+        return
+    gm = games[game_id]
+    await websocket.accept()
+
+    pending = None  # 目前決策狀態的推薦計算（背景執行）
+
+    async def push_recommendation():
+        try:
+            rec = await run_in_threadpool(recommend, gm)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "data": {"status": e.status_code, "detail": e.detail}})
+            return
+        await websocket.send_json({"type": "recommendation", "data": format_analysis(rec)})
+
+    def prefetch():
+        nonlocal pending
+        pending = asyncio.create_task(push_recommendation()) if not gm.finish else None
+
+    await websocket.send_json({"type": "state", "data": format_game_state(game_id, gm)})
+    prefetch()
+
+    try:
+        while True:
+            # 不合法的訊息只回錯誤，不中斷連線
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "data": {"status": 400, "detail": "Message must be a JSON object"}})
+                continue
+
+            # 評分要用同一個推薦，先等背景計算完成（之後 recommend 會直接沿用）
+            if pending is not None:
+                await pending
+                pending = None
+
+            kind = message.get("type")
+            try:
+                if kind == "action":
+                    state, _, mistakes = await run_in_threadpool(apply_action, game_id, gm, str(message.get("action", "")))
+                    for mistake in mistakes:
+                        await websocket.send_json({"type": "mistake", "data": mistake})
+                    await websocket.send_json({"type": "state", "data": state})
+                    prefetch()
+                elif kind == "analysis":
+                    rec = await run_in_threadpool(recommend, gm)
+                    await websocket.send_json({"type": "recommendation", "data": format_analysis(rec)})
+                elif kind == "next_round":
+                    state = advance_round(game_id, gm)
+                    await websocket.send_json({"type": "state", "data": state})
+                    prefetch()
+                elif kind == "state":
+                    await websocket.send_json({"type": "state", "data": format_game_state(game_id, gm)})
+                else:
+                    raise HTTPException(status_code=400, detail="Unknown message type")
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "data": {"status": e.status_code, "detail": e.detail}})
+    except WebSocketDisconnect:
+        if pending is not None:
+            pending.cancel()
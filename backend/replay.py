@@ -0,0 +1,199 @@
+"""
+========================================================================================================================
+Package
+========================================================================================================================
+"""
+import os, sys
+sys.path.append(os.path.abspath(os.path.join(__file__, '..')))
+
+import importlib
+import json
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+import click
+
+import database
+from Shoe import Shoe
+from Simulator import Simulator
+from Utils import *
+
+
+"""
+========================================================================================================================
+Recommendation Engines
+========================================================================================================================
+"""
+# name -> factory(shoe, num_sim, rng_seed) returning an object with evaluate_all(player_cards, dealer_cards)
+ENGINES: Dict[str, Callable] = {
+    'plain': lambda shoe, num_sim, rng_seed: Simulator(shoe, num_sim, rng_seed = rng_seed),
+    'stratified': lambda shoe, num_sim, rng_seed: Simulator(shoe, num_sim, rng_seed = rng_seed, sampling = 'stratified'),
+    'neyman': lambda shoe, num_sim, rng_seed: Simulator(shoe, num_sim, rng_seed = rng_seed, sampling = 'stratified', allocation = 'neyman'),
+}
+
+
+def load_engine(spec: str) -> Callable:
+
+    # Either a registered name or "module:factory" with the same factory signature
+    if spec in ENGINES:
+        return ENGINES[spec]
+    if ':' in spec:
+        module_name, attr = spec.split(':', 1)
+        return getattr(importlib.import_module(module_name), attr)
+
+    raise click.BadParameter("Unknown engine {} (choose from {} or module:factory)".format(spec, ', '.join(ENGINES)))
+
+
+"""
+========================================================================================================================
+Decision State Reconstruction
+========================================================================================================================
+"""
+class SessionState():
+
+    """
+    One logged game replayed in order: the shoe loses every logged card as it first appears.
+    Only the visible cards are logged (not the hole card, dealer draws or a final hit), so later states are approximate.
+    """
+    def __init__(self, game_id: str, num_decks: int, seed: int) -> None:
+
+        # One seeded shoe per logged game, so every replay of a session sees the same shoe
+        self.shoe = Shoe(num_decks, rng = random.Random('{}:{}'.format(seed, game_id)))
+        self.player_cards: List[Rank] = []
+        self.upcard = None
+
+        return
+
+    def _remove(self, cards: List[Rank]) -> None:
+
+        for card in cards:
+            if self.shoe.counts.get(card, 0) > 0:
+                self.shoe.remove_card(card)
+
+        return
+
+    def advance(self, log: Dict) -> tuple:
+
+        player_cards = [parse_card(c) for c in log['player_hand']]
+        dealer_cards = [parse_card(log['dealer_upcard'])]
+
+        # Same round after a HIT: only the new player cards leave the shoe; otherwise a new round was dealt
+        if dealer_cards[0] == self.upcard and player_cards[:len(self.player_cards)] == self.player_cards:
+            self._remove(player_cards[len(self.player_cards):])
+        else:
+            self._remove(player_cards + dealer_cards)
+        self.player_cards, self.upcard = player_cards, dealer_cards[0]
+
+        return player_cards, dealer_cards, self.shoe.clone()
+
+
+"""
+========================================================================================================================
+Replay
+========================================================================================================================
+"""
+def replay(logs: List[Dict], factory: Callable, num_decks: int, num_sim: int, seed: int, game_decks: Dict[str, int] = None) -> Dict:
+
+    sessions: Dict[str, SessionState] = {}
+    latencies = []
+    agreed = 0
+    by_action = Counter()
+    agreed_by_action = Counter()
+    disagreements = Counter()
+
+    start = time.perf_counter()
+    for log in logs:
+
+        if log['game_id'] not in sessions:
+            sessions[log['game_id']] = SessionState(log['game_id'], (game_decks or {}).get(log['game_id'], num_decks), seed)
+        player_cards, dealer_cards, shoe = sessions[log['game_id']].advance(log)
+
+        # Engine seeded per row: the same log replays to the same answers
+        engine = factory(shoe, num_sim, seed * 1000003 + log['id'])
+
+        t0 = time.perf_counter()
+        rec = engine.evaluate_all(player_cards, dealer_cards)
+        latencies.append(time.perf_counter() - t0)
+
+        logged = (log['action_recommended'] or '').upper()
+        replayed = rec['best_action'].upper()
+        by_action[logged] += 1
+        if logged == replayed:
+            agreed += 1
+            agreed_by_action[logged] += 1
+        else:
+            disagreements['{}->{}'.format(logged, replayed)] += 1
+
+    wall = time.perf_counter() - start
+    n = len(latencies)
+
+    return {
+        'states': n,
+        'wall_seconds': wall,
+        'throughput': n / wall if wall else 0.0,
+        'latency_ms': {
+            'mean': sum(latencies) / n * 1000 if n else 0.0,
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000 if n else 0.0
+        },
+        'agreement': agreed / n if n else 0.0,
+        'agreement_by_logged_action': {a: agreed_by_action[a] / c for a, c in sorted(by_action.items())},
+        'disagreements': dict(disagreements.most_common())
+    }
+
+
+@click.command()
+@click.option('--engine', 'engines', multiple = True, default = ['plain'], show_default = True,
+              help = 'Engine name ({}) or module:factory; repeat to compare.'.format(', '.join(ENGINES)))
+@click.option('--db', default = None, help = 'SQLite file holding action_logs (default: database.DB_NAME).')
+@click.option('--game-id', default = None, help = 'Replay a single session.')
+@click.option('--limit', default = None, type = int, help = 'Replay at most this many states.')
+@click.option('--num-decks', default = 6, show_default = True, help = 'Shoe size assumed for logged sessions.')
+@click.option('--game-decks', multiple = True, help = 'GAME_ID=N shoe size for one session (overrides --num-decks); repeatable.')
+@click.option('--num-sim', default = 10000, show_default = True)
+@click.option('--seed', default = 0, show_default = True)
+@click.option('--json-out', default = None, help = 'Also write the report as JSON.')
+def main(engines, db, game_id, limit, num_decks, game_decks, num_sim, seed, json_out):
+
+    try:
+        game_decks = {g: int(n) for g, n in (item.rsplit('=', 1) for item in game_decks)}
+    except ValueError:
+        raise click.BadParameter('expected GAME_ID=N', param_hint = '--game-decks')
+
+    if db:
+        database.DB_NAME = db
+    logs = database.get_action_logs(game_id = game_id, limit = limit)
+
+    reports = {}
+    for spec in engines:
+        report = replay(logs, load_engine(spec), num_decks, num_sim, seed, game_decks)
+        reports[spec] = report
+
+        click.echo()
+        click.echo('[{}] states={states}  wall={wall_seconds:.1f}s  throughput={throughput:.1f} states/s  agreement={agreement:.1%}'.format(spec, **report))
+        click.echo('  latency ms: mean={mean:.1f}  p50={p50:.1f}  p95={p95:.1f}  p99={p99:.1f}  max={max:.1f}'.format(**report['latency_ms']))
+        for logged, rate in report['agreement_by_logged_action'].items():
+            click.echo('  logged {:<7} agreement={:.1%}'.format(logged, rate))
+        if report['disagreements']:
+            click.echo('  disagreements: {}'.format(', '.join('{} x{}'.format(k, v) for k, v in report['disagreements'].items())))
+    click.echo()
+
+    if json_out:
+        with open(json_out, 'w') as f:
+            json.dump(reports, f, indent = 2)
+
+    return
+
+
+"""
+========================================================================================================================
+Main Function
+========================================================================================================================
+"""
+if __name__ == "__main__":
+
+    main()